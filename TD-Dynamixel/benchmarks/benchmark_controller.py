@@ -0,0 +1,406 @@
+'''
+Throughput benchmark for scripts/dynamixel_controller.py, runs outside TouchDesigner on the simulated bus.
+
+The controller is loaded with small stand-ins for the TouchDesigner objects it uses (table DATs, the Script
+CHOP and its custom parameters) and every scenario drives onCook or a handler against sim:// motors.
+
+Reported per scenario:
+    cooks/s         calls per second of the cook or handler
+    python ms       wall time per call minus the time spent waiting for status packets
+    wire ms         time the simulated bus was busy per call (bytes at the baudrate plus return delays)
+    alloc peak kB   peak memory allocated on top of the steady state during one call (median), the
+                    temporaries a call creates and the garbage collector has to deal with
+
+Usage (from the repository root, dynamixel_sdk and numpy installed):
+    python TD-Dynamixel/benchmarks/benchmark_controller.py
+    python TD-Dynamixel/benchmarks/benchmark_controller.py --motors 1 8 32 --iterations 100
+    python TD-Dynamixel/benchmarks/benchmark_controller.py --update-baseline
+
+Results are compared against baseline.json next to this file, a scenario is reported as a regression when
+its cooks/s dropped by more than --tolerance. The baseline is only meaningful on the machine it was taken on.
+'''
+import argparse
+import builtins
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.join(os.path.dirname(BENCHMARK_DIR), 'scripts')
+CONTROLLER_PATH = os.path.join(SCRIPTS_DIR, 'dynamixel_controller.py')
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, 'baseline.json')
+CONTROL_TABLES_FILE = os.path.join(BENCHMARK_DIR, '..', 'configurations', 'ControlTables.csv')
+
+sys.path.insert(0, SCRIPTS_DIR)
+from dynamixel_sim import SimulatedMotor, SimulatedPortHandler, parse_sim_port_name
+
+DEFAULT_MOTOR_COUNTS = [1, 4, 16, 64]
+DEFAULT_ITERATIONS = 200
+DEFAULT_BAUDRATE = 1000000
+DEFAULT_TOLERANCE = 0.2
+SELECTIONS = ['all', 'half']
+
+# simulated motor Baud Rate register values
+SIM_BAUD_RATE_INDEX = {57600: 1, 115200: 2, 1000000: 3, 2000000: 4, 3000000: 5, 4000000: 6, 4500000: 7}
+
+################################################################################################################################
+'''
+TouchDesigner stand-ins
+Only what dynamixel_controller.py touches: op(), table DAT cells, custom pages/parameters and Script CHOP channels
+'''
+class Cell:
+    def __init__(self, val='') -> None:
+        self.val = str(val)
+
+    def __int__(self):
+        return int(self.val)
+
+    def __float__(self):
+        return float(self.val)
+
+    def __str__(self):
+        return self.val
+
+class TableDAT:
+    def __init__(self, rows=None) -> None:
+        self.Rows = [[Cell(val) for val in row] for row in (rows or [])]
+
+    @property
+    def numRows(self):
+        return len(self.Rows)
+
+    @property
+    def numCols(self):
+        return max((len(row) for row in self.Rows), default=0)
+
+    def __getitem__(self, key):
+        row, col = key
+        if row >= len(self.Rows) or col >= len(self.Rows[row]):
+            return None
+        return self.Rows[row][col]
+
+    def __setitem__(self, key, val):
+        row, col = key
+        cells = self.Rows[row]
+        while len(cells) <= col:
+            cells.append(Cell())
+        cells[col] = Cell(val)
+
+    def clear(self):
+        self.Rows = []
+
+    def appendCol(self, vals=None):
+        pass
+
+    def appendRow(self, vals):
+        self.Rows.append([Cell(val) for val in vals])
+
+class Par:
+    def __init__(self, name: str, val=None) -> None:
+        self.name = name
+        self.val = val
+        self.default = val
+        self.menuNames = []
+        self.menuLabels = []
+
+    def eval(self):
+        return self.val
+
+class ParCollection:
+    def __init__(self) -> None:
+        self._pars = {}
+
+    def __getitem__(self, name):
+        return self._pars.get(name)
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name not in self._pars:
+            raise AttributeError(name)
+        return self._pars[name]
+
+    def add(self, par: Par):
+        self._pars[par.name] = par
+        return [par]
+
+class Page:
+    def __init__(self, pars: ParCollection) -> None:
+        self._pars = pars
+
+    def appendToggle(self, name, label=None):
+        return self._pars.add(Par(name, False))
+
+    def appendPulse(self, name, label=None):
+        return self._pars.add(Par(name))
+
+    def appendMenu(self, name, label=None):
+        return self._pars.add(Par(name, ''))
+
+    def appendFloat(self, name, label=None, size=1):
+        return self._pars.add(Par(name, 0.0))
+
+    def appendInt(self, name, label=None, size=1):
+        return self._pars.add(Par(name, 0))
+
+    def appendStr(self, name, label=None):
+        return self._pars.add(Par(name, ''))
+
+    def appendFile(self, name, label=None):
+        return self._pars.add(Par(name, ''))
+
+    def appendFolder(self, name, label=None):
+        return self._pars.add(Par(name, ''))
+
+    def appendCHOP(self, name, label=None):
+        return self._pars.add(Par(name))
+
+class Channel:
+    def __init__(self, name: str, num_samples: int) -> None:
+        self.name = name
+        self.vals = [0.0] * num_samples
+
+    def __getitem__(self, index):
+        return self.vals[index]
+
+    def __setitem__(self, index, val):
+        self.vals[index] = val
+
+    def copyNumpyArray(self, array):
+        self.vals = array.copy()
+
+class ScriptCHOP:
+    def __init__(self) -> None:
+        self.par = ParCollection()
+        self.inputs = []
+        self.numSamples = 1
+        self.Channels = []
+
+    def appendCustomPage(self, name):
+        return Page(self.par)
+
+    def clear(self):
+        self.Channels = []
+
+    def appendChan(self, name):
+        channel = Channel(name, self.numSamples)
+        self.Channels.append(channel)
+        return channel
+
+################################################################################################################################
+'''
+Controller setup
+'''
+def make_sim_port_handler(port_name: str, baudrate: int):
+    '''
+    simulated motors already at the benchmark baudrate with no return delay, like a tuned bus
+    '''
+    motors = [SimulatedMotor(motor_id, baud_rate=SIM_BAUD_RATE_INDEX[baudrate], return_delay_time=0)
+              for motor_id in parse_sim_port_name(port_name)]
+    return SimulatedPortHandler(port_name, motors)
+
+def load_controller(motor_count: int, baudrate: int):
+    ops = {
+        'GlobalCommConfig': TableDAT([['Parameters', 'Value'], ['port', f'sim://{motor_count}'], ['baudrate', baudrate], ['protocol', 2]]),
+        'GlobalMotorsConfig': TableDAT([['MotorID', 'Type', 'VelocityLimit']] + [[motor_id, 'X_SERIES', 1023] for motor_id in range(1, motor_count + 1)]),
+        'DynamixelController': ScriptCHOP(),
+        'DynamixelMotorsRAM': TableDAT(),
+        'DynamixelMotorsEEPROM': TableDAT(),
+        'Debug': TableDAT()
+    }
+    builtins.op = ops.get
+
+    spec = importlib.util.spec_from_file_location('dynamixel_controller', CONTROLLER_PATH)
+    controller = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(controller)
+    controller.make_port_handler = lambda port_name: make_sim_port_handler(port_name, baudrate)
+    controller.DEFAULT_CONTROL_TABLES_FILE = CONTROL_TABLES_FILE
+    # keep the topology cache out of the working directory
+    controller.DEFAULT_TOPOLOGY_FILE = os.path.join(tempfile.gettempdir(), 'dynamixel_benchmark_topology.json')
+
+    script_op = ops['DynamixelController']
+    controller.onSetupParameters(script_op)
+    if len(controller.MOTORS) != motor_count:
+        raise RuntimeError(f"{len(controller.MOTORS)} of {motor_count} simulated motors answered the broadcast ping")
+
+    return controller, script_op
+
+def select_motors(controller, script_op, selection: str) -> list:
+    selected = []
+    for index, motor in enumerate(controller.MOTORS):
+        is_selected = selection == 'all' or index % 2 == 0
+        script_op.par[f'Motor{motor.ID}'].val = is_selected
+        if is_selected:
+            selected.append(motor)
+
+    return selected
+
+def set_table_goals(controller, motors: list, ram_row, iteration: int):
+    '''
+    new goals on every call so the goal deadband never skips a motor
+    '''
+    for motor in motors:
+        controller.write_to_table(1024 + (iteration + motor.ID) % 2048, controller.RAM_TABLE,
+                                  controller.get_row_index_by_motor_id(motor.ID), ram_row.value)
+
+################################################################################################################################
+'''
+Scenarios
+each returns a function running one iteration
+'''
+def make_cook(controller, script_op, motors, read_mode: str, write_mode: str, output_mode: str = 'table', record: bool = False):
+    script_op.par[controller.COOK_READ_MODE].val = read_mode
+    script_op.par[controller.COOK_WRITE_MODE].val = write_mode
+    script_op.par[controller.OUTPUT_MODE].val = output_mode
+    script_op.par[controller.RECORD].val = record
+    script_op.par[controller.RECORD_FOLDER].val = os.path.join(tempfile.gettempdir(), 'dynamixel_benchmark_recordings')
+    script_op.par[controller.RECORD_FILES].val = 1
+
+    def cook(iteration: int):
+        if write_mode != controller.COOK_WRITE_NONE:
+            set_table_goals(controller, motors, controller.RAM.GOAL_POSITION, iteration)
+        controller.onCook(script_op)
+
+    return cook
+
+def make_handler(controller, motors, handler, ram_row=None):
+    def call(iteration: int):
+        if ram_row is not None:
+            set_table_goals(controller, motors, ram_row, iteration)
+        handler()
+        # write pulses only queue, the next cook sends them
+        controller.flush_commands()
+
+    return call
+
+SCENARIOS = {
+    'cook_position': lambda c, s, m: make_cook(c, s, m, c.COOK_READ_POSITION, c.COOK_WRITE_NONE),
+    'cook_state': lambda c, s, m: make_cook(c, s, m, c.COOK_READ_STATE, c.COOK_WRITE_NONE),
+    'cook_state_channels': lambda c, s, m: make_cook(c, s, m, c.COOK_READ_STATE, c.COOK_WRITE_NONE, c.OUTPUT_CHANNELS),
+    'cook_state_record': lambda c, s, m: make_cook(c, s, m, c.COOK_READ_STATE, c.COOK_WRITE_NONE, c.OUTPUT_CHANNELS, True),
+    'cook_write_goal_position': lambda c, s, m: make_cook(c, s, m, c.COOK_READ_POSITION, c.COOK_WRITE_GOAL_POSITION),
+    'handler_read_current_position': lambda c, s, m: make_handler(c, m, c.handler_read_current_position),
+    'handler_write_goal_position': lambda c, s, m: make_handler(c, m, c.handler_write_goal_position, c.RAM.GOAL_POSITION),
+    'handler_write_goal_velocity': lambda c, s, m: make_handler(c, m, c.handler_write_goal_velocity, c.RAM.GOAL_VELOCITY)
+}
+
+def get_wire_time(controller) -> float:
+    return sum(bus.PortHandler.WireTime for bus in controller.BUSES.values())
+
+def get_wait_time(controller) -> float:
+    return sum(bus.PortHandler.WaitTime for bus in controller.BUSES.values())
+
+def measure(controller, run, iterations: int) -> dict:
+    # warm up plan caches and table rows
+    for iteration in range(3):
+        run(iteration)
+
+    wire_start = get_wire_time(controller)
+    wait_start = get_wait_time(controller)
+    start = time.perf_counter()
+    for iteration in range(iterations):
+        run(iteration)
+    elapsed = time.perf_counter() - start
+    wire = get_wire_time(controller) - wire_start
+    wait = get_wait_time(controller) - wait_start
+
+    # memory pass, kept apart because tracing slows every allocation down
+    alloc_iterations = max(iterations // 10, 5)
+    tracemalloc.start()
+    run(0)
+    peaks = []
+    for iteration in range(alloc_iterations):
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        run(iteration)
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+
+    return {
+        'cooks_per_s': round(iterations / elapsed, 1),
+        'python_ms': round(max(elapsed - wait, 0.0) / iterations * 1000.0, 4),
+        'wire_ms': round(wire / iterations * 1000.0, 4),
+        'alloc_peak_kb': round(sorted(peaks)[len(peaks) // 2] / 1024.0, 2)
+    }
+
+def run_benchmarks(motor_counts: list, iterations: int, baudrate: int, scenario_names: list) -> dict:
+    results = {}
+    for motor_count in motor_counts:
+        controller, script_op = load_controller(motor_count, baudrate)
+        for selection in SELECTIONS:
+            motors = select_motors(controller, script_op, selection)
+            if selection != 'all' and len(motors) == motor_count:
+                continue
+
+            for scenario_name in scenario_names:
+                run = SCENARIOS[scenario_name](controller, script_op, motors)
+                name = f'{scenario_name}/{motor_count}/{selection}'
+                results[name] = measure(controller, run, iterations)
+                print(format_result(name, results[name]))
+
+        controller.close_ports()
+
+    return results
+
+################################################################################################################################
+'''
+Report
+'''
+def format_result(name: str, result: dict) -> str:
+    return (f"{name:<48} {result['cooks_per_s']:>9.1f} cooks/s  python {result['python_ms']:>8.3f} ms  "
+            f"wire {result['wire_ms']:>8.3f} ms  alloc peak {result['alloc_peak_kb']:>7.2f} kB")
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+
+        expected = baseline[name]['cooks_per_s']
+        if result['cooks_per_s'] < expected * (1.0 - tolerance):
+            regressions.append(f"{name}: {result['cooks_per_s']} cooks/s, baseline {expected} cooks/s")
+
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--motors', type=int, nargs='+', default=DEFAULT_MOTOR_COUNTS)
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument('--baudrate', type=int, default=DEFAULT_BAUDRATE, choices=sorted(SIM_BAUD_RATE_INDEX))
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.motors, args.iterations, args.baudrate, args.scenarios)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --update-baseline to create one")
+        return 0
+
+    with open(args.baseline) as file:
+        regressions = compare_to_baseline(results, json.load(file), args.tolerance)
+
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print(f"No scenario slower than the baseline by more than {args.tolerance:.0%}")
+
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
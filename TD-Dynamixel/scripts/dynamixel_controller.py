@@ -1,20 +1,31 @@
+from concurrent.futures import ThreadPoolExecutor, wait
 from enum import Enum
-from typing import List
+from typing import Dict, List, Tuple
 from datetime import datetime
+import asyncio
+import copy
+import csv
+import json
+import math
 import os
+import struct
+import threading
+import time
 
-# Import suitable modules based on current OS (Windows/Mac)
+import numpy as np
+
+# Import suitable modules based on current OS (Windows/Mac), stdin is only touched when getch is called
 if os.name == 'nt':
-    import msvcrt
     def getch():
+        import msvcrt
         return msvcrt.getch().decode()
 else:
-    import sys, tty, termios
-    fd = sys.stdin.fileno()
-    old_settings = termios.tcgetattr(fd)
     def getch():
+        import sys, tty, termios
+        fd = sys.stdin.fileno()
+        old_settings = termios.tcgetattr(fd)
         try:
-            tty.setraw(sys.stdin.fileno())
+            tty.setraw(fd)
             ch = sys.stdin.read(1)
         finally:
             termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
@@ -26,8 +37,34 @@ from dynamixel_sdk import *  # Uses Dynamixel SDK library
 '''
 Global Config Parser
 '''
-GLOBAL_COMM_CONFIG = op('GlobalCommConfig')
-GLOBAL_MOTORS_CONFIG = op('GlobalMotorsConfig')
+class Lazy:
+    '''
+    object created by factory on first use, importing the module then needs neither the TouchDesigner
+    project nor a port. reset() drops it so the next use picks up a changed config or operator
+    '''
+    def __init__(self, factory) -> None:
+        self.Factory = factory
+        self.Object = None
+
+    def get(self):
+        if self.Object is None:
+            self.Object = self.Factory()
+        return self.Object
+
+    def reset(self):
+        self.Object = None
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+    def __getitem__(self, key):
+        return self.get()[key]
+
+    def __setitem__(self, key, value):
+        self.get()[key] = value
+
+GLOBAL_COMM_CONFIG = Lazy(lambda: op('GlobalCommConfig'))
+GLOBAL_MOTORS_CONFIG = Lazy(lambda: op('GlobalMotorsConfig'))
 
 class MotorConfigNotFound(Exception):
     pass
@@ -44,12 +81,95 @@ def get_protocol() -> float:
 def get_motor_num_from_config():
     return int(GLOBAL_MOTORS_CONFIG.numRows - 1)
 
-def get_motor_type(motor_id: int) -> str:
+# optional GlobalMotorsConfig columns putting a motor on its own port, empty cells use GlobalCommConfig
+MOTORS_CONFIG_PORT_COL = 'Port'
+MOTORS_CONFIG_BAUDRATE_COL = 'Baudrate'
+
+# motor id -> motor type / (port name, baudrate) from GlobalMotorsConfig, rebuilt by index_motor_types
+MOTOR_TYPE_INDEX: Dict[int, str] = {}
+MOTOR_PORT_INDEX: Dict[int, Tuple[str, int]] = {}
+# GlobalMotorsConfig operator and config version the index was built from
+MOTOR_INDEX_TABLE = None
+MOTOR_INDEX_VERSION = None
+
+def get_config_version(table):
+    '''
+    changes whenever the table does: its cook counter in TouchDesigner, else a hash of its cells
+    '''
+    total_cooks = getattr(table, 'totalCooks', None)
+    if total_cooks is not None:
+        return total_cooks
+
+    return hash(tuple(str(table[row, col].val) for row in range(table.numRows) for col in range(table.numCols)))
+
+def get_motor_index_version():
+    # ports without a Port cell follow GlobalCommConfig
+    return get_config_version(GLOBAL_MOTORS_CONFIG.get()), get_config_version(GLOBAL_COMM_CONFIG.get())
+
+def get_motors_config_col(name: str) -> int:
+    for col in range(GLOBAL_MOTORS_CONFIG.numCols):
+        cell = GLOBAL_MOTORS_CONFIG[0, col]
+        if cell is not None and str(cell.val).strip() == name:
+            return col
+
+    return None
+
+def get_motors_config_cell(row: int, col: int) -> str:
+    if col is None:
+        return ''
+
+    cell = GLOBAL_MOTORS_CONFIG[row, col]
+    return '' if cell is None else str(cell.val).strip()
+
+def index_motor_types():
+    global MOTOR_INDEX_TABLE, MOTOR_INDEX_VERSION
+    MOTOR_INDEX_TABLE, MOTOR_INDEX_VERSION = GLOBAL_MOTORS_CONFIG.get(), get_motor_index_version()
+
+    MOTOR_TYPE_INDEX.clear()
+    MOTOR_PORT_INDEX.clear()
+    port_col = get_motors_config_col(MOTORS_CONFIG_PORT_COL)
+    baudrate_col = get_motors_config_col(MOTORS_CONFIG_BAUDRATE_COL)
+
     for i in range(1, GLOBAL_MOTORS_CONFIG.numRows):
-        if int(GLOBAL_MOTORS_CONFIG[i, 0]) == motor_id:
-            return str(GLOBAL_MOTORS_CONFIG[i, 1].val)
+        motor_id = int(GLOBAL_MOTORS_CONFIG[i, 0])
+        MOTOR_TYPE_INDEX[motor_id] = str(GLOBAL_MOTORS_CONFIG[i, 1].val)
+
+        port_name = get_motors_config_cell(i, port_col) or get_port_name()
+        baudrate = get_motors_config_cell(i, baudrate_col)
+        MOTOR_PORT_INDEX[motor_id] = (port_name, int(baudrate) if baudrate else get_baudrate())
 
-    raise MotorConfigNotFound(f"Motor type not found for ID: {motor_id}")
+def ensure_motor_index() -> bool:
+    '''
+    rebuild the index once GlobalMotorsConfig or GlobalCommConfig changed, returns whether it was rebuilt
+    '''
+    if GLOBAL_MOTORS_CONFIG.get() is MOTOR_INDEX_TABLE and get_motor_index_version() == MOTOR_INDEX_VERSION:
+        return False
+
+    index_motor_types()
+    return True
+
+def get_port_configs() -> Dict[str, int]:
+    '''
+    port name -> baudrate of every port used by GlobalCommConfig and GlobalMotorsConfig
+    '''
+    ensure_motor_index()
+
+    # the GlobalCommConfig port is only opened when no motor is configured or a motor is left on it
+    port_configs = {} if MOTOR_PORT_INDEX else {get_port_name(): get_baudrate()}
+    for motor_id, (port_name, baudrate) in MOTOR_PORT_INDEX.items():
+        if port_configs.setdefault(port_name, baudrate) != baudrate:
+            print(f"MotorID {motor_id} baudrate {baudrate} differs from {port_configs[port_name]} already set for {port_name}, ignoring it")
+
+    return port_configs
+
+def get_motor_type(motor_id: int) -> str:
+    ensure_motor_index()
+
+    motor_type = MOTOR_TYPE_INDEX.get(motor_id)
+    if motor_type is None:
+        raise MotorConfigNotFound(f"Motor type not found for ID: {motor_id}")
+
+    return motor_type
 
 
 ################################################################################################################################
@@ -70,55 +190,394 @@ class DataAccess(Enum):
     READ = 2
 
 class ControlData:
-    def __init__(self, address: int, data_size_byte: int, data_access: DataAccess = DataAccess.READ) -> None:
+    def __init__(self, address: int, data_size_byte: int, data_access: DataAccess = DataAccess.READ, signed: bool = False) -> None:
         self.Address = address
         self.DataSize = data_size_byte
         self.DataAccess = data_access
+        self.Signed = signed
+
+    def get_range(self) -> Tuple[int, int]:
+        '''
+        lowest and highest value the register can hold
+        '''
+        bits = 8 * self.DataSize
+        if self.Signed:
+            return -(1 << (bits - 1)), (1 << (bits - 1)) - 1
+
+        return 0, (1 << bits) - 1
+
+# struct format character for each (data size, signedness) of a control table item
+STRUCT_FORMATS = {
+    (1, False): 'B',
+    (1, True) : 'b',
+    (2, False): 'H',
+    (2, True) : 'h',
+    (4, False): 'I',
+    (4, True) : 'i'
+}
+
+def compile_layout(span: ControlData, fields: List[ControlData]) -> struct.Struct:
+    '''
+    build a little endian struct for decoding a block read of span into fields (sorted by address)
+    '''
+    layout = '<'
+    offset = span.Address
+    for field in fields:
+        if field.Address > offset:
+            layout += f'{field.Address - offset}x'
+        layout += STRUCT_FORMATS[(field.DataSize, field.Signed)]
+        offset = field.Address + field.DataSize
+
+    span_end = span.Address + span.DataSize
+    if span_end > offset:
+        layout += f'{span_end - offset}x'
+
+    return struct.Struct(layout)
+
+class BlockLayout:
+    '''
+    precompiled struct decoding a block read of span, values come out in the order of fields (table row, register)
+    with None for the registers the model does not have
+    '''
+    def __init__(self, control_table, span: ControlData, fields: list) -> None:
+        present = sorted((field for field in fields if control_table.has(field[1])),
+                         key=lambda field: getattr(control_table, field[1]).Address)
+        self.Span = span
+        self.Rows = [row for row, _ in fields]
+        self.Struct = compile_layout(span, [getattr(control_table, name) for _, name in present])
+        # index in fields of every decoded value, None when they already come out in that order
+        self.Order = [fields.index(field) for field in present]
+        if self.Order == list(range(len(fields))):
+            self.Order = None
+
+    def decode(self, block) -> tuple:
+        values = self.Struct.unpack(block)
+        if self.Order is None:
+            return values
+
+        ordered = [None] * len(self.Rows)
+        for index, value in zip(self.Order, values):
+            ordered[index] = value
+        return tuple(ordered)
+
+################################################################################################################################
+'''
+Control Table Registry
+Register address, size, signedness and access of every motor type, one row per register in the ControlTables
+DAT or configurations/ControlTables.csv when the project has no such DAT. Spans read in one block are planned
+from the registers each model has, so motors of different models get their own address and length in a bulk read.
+'''
+CONTROL_TABLES_CONFIG = Lazy(lambda: op('ControlTables'))
+DEFAULT_CONTROL_TABLES_FILE = os.path.join('configurations', 'ControlTables.csv')
+CONTROL_TABLES_COLUMNS = ['Type', 'Register', 'Address', 'Size', 'Signed', 'Access']
+DATA_ACCESS_NAMES = {'R': DataAccess.READ, 'RW': DataAccess.READ_AND_WRITE}
+
+# unused bytes read through before a span is split, another transaction costs more than this on the wire
+READ_SPAN_MAX_GAP = 16
+
+# motor type -> register name -> ControlData, loaded on first use
+CONTROL_TABLE_REGISTRY: Dict[str, Dict[str, ControlData]] = {}
+# motor type -> ControlTable shared by every motor of that type
+CONTROL_TABLES: Dict[str, 'ControlTable'] = {}
+
+def get_control_tables_file() -> str:
+    '''
+    DEFAULT_CONTROL_TABLES_FILE in the project folder, TouchDesigner does not run with it as working directory
+    '''
+    try:
+        folder = project.folder
+    except NameError:
+        # outside TouchDesigner the scripts folder sits next to configurations
+        folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+    return os.path.join(folder, DEFAULT_CONTROL_TABLES_FILE)
+
+def read_control_tables_rows() -> List[List[str]]:
+    table = CONTROL_TABLES_CONFIG.get()
+    if table is not None:
+        return [[str(table[row, col].val).strip() for col in range(table.numCols)] for row in range(table.numRows)]
+
+    with open(get_control_tables_file(), newline='') as file:
+        return [[cell.strip() for cell in row] for row in csv.reader(file) if row]
+
+def load_control_table_registry() -> Dict[str, Dict[str, ControlData]]:
+    rows = read_control_tables_rows()
+    columns = [rows[0].index(name) for name in CONTROL_TABLES_COLUMNS]
+
+    registry = {}
+    for row in rows[1:]:
+        motor_type, register, address, size, signed, access = (row[column] for column in columns)
+        registry.setdefault(motor_type, {})[register] = ControlData(int(address), int(size), DATA_ACCESS_NAMES[access],
+                                                                    signed=bool(int(signed)))
+
+    return registry
+
+def get_control_table_registry() -> Dict[str, Dict[str, ControlData]]:
+    if not CONTROL_TABLE_REGISTRY:
+        CONTROL_TABLE_REGISTRY.update(load_control_table_registry())
+
+    return CONTROL_TABLE_REGISTRY
+
+def reset_control_table_registry():
+    '''
+    reload the registry on next use, motors keep the control tables they were created with
+    '''
+    CONTROL_TABLE_REGISTRY.clear()
+    CONTROL_TABLES.clear()
+
+def plan_read_spans(registers: Dict[str, ControlData], names: List[str], max_gap: int = READ_SPAN_MAX_GAP) -> List[ControlData]:
+    '''
+    merge the named registers the model has into the fewest contiguous spans, registers at most max_gap bytes
+    apart share a span (None reads everything in one span)
+    '''
+    items = sorted((registers[name] for name in names if name in registers), key=lambda item: item.Address)
+
+    spans = []
+    start = end = None
+    for item in items:
+        if start is not None and (max_gap is None or item.Address - end <= max_gap):
+            end = max(end, item.Address + item.DataSize)
+            continue
+        if start is not None:
+            spans.append(ControlData(start, end - start, DataAccess.READ))
+        start, end = item.Address, item.Address + item.DataSize
+
+    if start is not None:
+        spans.append(ControlData(start, end - start, DataAccess.READ))
+
+    return spans
+
+def plan_read_span(registers: Dict[str, ControlData], names: List[str]) -> ControlData:
+    spans = plan_read_spans(registers, names, max_gap=None)
+    return spans[0] if spans else None
 
 class ControlTable:
+    '''
+    registers of one motor type as attributes (e.g. ControlTable.GoalPosition) plus the spans read in one block
+    '''
     def __init__(self, motor_type: str) -> None:
-        if motor_type == 'X_SERIES' or motor_type == 'MX_SERIES':
-            self.OperatingMode         = ControlData(11, 1, DataAccess.READ_AND_WRITE)
-            self.Torque                = ControlData(64, 1, DataAccess.READ_AND_WRITE)
-            self.GoalVelocity          = ControlData(104, 4, DataAccess.READ_AND_WRITE)
-            self.GoalPosition          = ControlData(116, 4, DataAccess.READ_AND_WRITE)
-            self.PresentPosition       = ControlData(132, 4, DataAccess.READ_AND_WRITE)
-        elif motor_type == 'PRO_SERIES':
-            raise NotImplementedError
-        elif motor_type == 'P_SERIES' or motor_type == 'PRO_A_SERIES':
-            raise NotImplementedError
-        elif motor_type == 'XL320':
-            raise NotImplementedError
-        else:
+        registry = get_control_table_registry()
+        if motor_type not in registry:
             raise MotorTypeNotSupported(
-                f"motor_type: {motor_type} is not supported. Supported motor type: X_SERIES, MX_SERIES, PRO_SERIES, P_SERIES, PRO_A_SERIES and XL320")
+                f"motor_type: {motor_type} is not supported. Supported motor type: {', '.join(registry)}")
+
+        self.Type = motor_type
+        # own copy, the indirect mapping adds registers to it
+        self.Registers = dict(registry[motor_type])
+        for name, control_data in self.Registers.items():
+            setattr(self, name, control_data)
+
+        # contiguous spans read in one block
+        self.EEPROMArea = plan_read_span(self.Registers, [name for _, name in EEPROM_FIELDS])
+        self.RAMArea = plan_read_span(self.Registers, [name for _, name in RAM_FIELDS])
+        self.PresentState = plan_read_span(self.Registers, [name for _, name in PRESENT_STATE_FIELDS])
+        # Baud Rate and Return Delay Time are adjacent and written together
+        self.CommSettings = plan_read_span(self.Registers, ['BaudRate', 'ReturnDelayTime'])
+        self.CommSettings.DataAccess = DataAccess.READ_AND_WRITE
+
+        # span attribute name -> layout decoding it into table rows
+        self.Layouts = {
+            'EEPROMArea'   : BlockLayout(self, self.EEPROMArea, EEPROM_FIELDS),
+            'RAMArea'      : BlockLayout(self, self.RAMArea, RAM_FIELDS),
+            'PresentState' : BlockLayout(self, self.PresentState, PRESENT_STATE_FIELDS)
+        }
+        # register names -> (span attribute name, registers it decodes) planned by plan_registers
+        self.RegisterSpans: Dict[tuple, List[Tuple[str, List[str]]]] = {}
+
+    def plan_registers(self, names: List[str]) -> List[Tuple[str, List[str]]]:
+        '''
+        spans covering the registers of names the model has, at most READ_SPAN_MAX_GAP bytes read through.
+        The span names only depend on names and their order so motors of every model share one ReadPlan per span
+        '''
+        key = tuple(names)
+        if key not in self.RegisterSpans:
+            planned = []
+            for index, span in enumerate(plan_read_spans(self.Registers, names)):
+                span_name = f"Span{index}:{','.join(names)}"
+                span_registers = [name for name in names if self.has(name) and
+                                  span.Address <= self.Registers[name].Address < span.Address + span.DataSize]
+                setattr(self, span_name, span)
+                self.Layouts[span_name] = BlockLayout(self, span, [(None, name) for name in span_registers])
+                planned.append((span_name, span_registers))
+            self.RegisterSpans[key] = planned
+
+        return self.RegisterSpans[key]
+
+    def has(self, name: str) -> bool:
+        return name in self.Registers
+
+    def __getattr__(self, name):
+        # only reached for registers the model does not have
+        raise AttributeError(f"{self.__dict__.get('Type')} has no {name} register")
+
+def get_control_table(motor_type: str) -> ControlTable:
+    if motor_type not in CONTROL_TABLES:
+        CONTROL_TABLES[motor_type] = ControlTable(motor_type)
+
+    return CONTROL_TABLES[motor_type]
 
 class Motor:
-    def __init__(self, id: int, motor_type: str) -> None:
+    def __init__(self, id: int, motor_type: str, model_number: int = 0, firmware: int = 0, bus=None) -> None:
         self.ID = id
-        self.ControlTable = ControlTable(motor_type)
+        self.Type = motor_type
+        self.ModelNumber = model_number
+        self.Firmware = firmware
+        self.Bus = bus
+        self.ControlTable = get_control_table(motor_type)
 
 ################################################################################################################################
 # Dynamixel
-PORT_HANDLER = PortHandler(get_port_name())
-PACKET_HANDLER = PacketHandler(get_protocol())
+# the packet handler only builds and parses packets, every bus shares it
+PACKET_HANDLER = Lazy(lambda: PacketHandler(get_protocol()))
 
 class CommError(Exception):
     pass
 
-def open_port():
-    if PORT_HANDLER.openPort():
-        print(f"Port {get_port_name()} successfully opened")
-    else:
-        raise CommError(f"Failed to open {get_port_name()} port, make sure port is available.")
+class GoalInputError(Exception):
+    pass
 
-    if PORT_HANDLER.setBaudRate(get_baudrate()):
-        print(f"Baudrate set to {get_baudrate()}")
-    else:
-        raise CommError(f"Failed to set baudrate to {get_baudrate()} on {get_port_name()}")
+# port names starting with this run on the simulated bus in dynamixel_sim.py instead of a serial port
+SIM_PORT_PREFIX = 'sim://'
 
-def close_port():
-    PORT_HANDLER.closePort()
+def make_port_handler(port_name: str):
+    if port_name.startswith(SIM_PORT_PREFIX):
+        # only needed without hardware, keep it out of the normal import
+        from dynamixel_sim import SimulatedPortHandler
+        return SimulatedPortHandler(port_name)
+
+    return PortHandler(port_name)
+
+class Bus:
+    '''
+    one serial port (e.g. one U2D2) with its own baudrate and motors, different buses run their transactions concurrently
+    '''
+    def __init__(self, port_name: str, baudrate: int) -> None:
+        self.PortName = port_name
+        self.Baudrate = baudrate
+        self.PortHandler = make_port_handler(port_name)
+
+    def open(self):
+        if self.PortHandler.openPort():
+            print(f"Port {self.PortName} successfully opened")
+        else:
+            raise CommError(f"Failed to open {self.PortName} port, make sure port is available.")
+
+        if self.PortHandler.setBaudRate(self.Baudrate):
+            print(f"Baudrate set to {self.Baudrate}")
+        else:
+            raise CommError(f"Failed to set baudrate to {self.Baudrate} on {self.PortName}")
+
+    def close(self):
+        if self.PortHandler.is_open:
+            self.PortHandler.closePort()
+
+    def broadcast_ping(self) -> dict:
+        start = time.perf_counter()
+        dxl_data_list, dxl_comm_result = PACKET_HANDLER.broadcastPing(self.PortHandler)
+        BUS_STATS.record('ping', start, dxl_comm_result)
+
+        if dxl_comm_result != COMM_SUCCESS:
+            tx_rx_res = PACKET_HANDLER.getTxRxResult(dxl_comm_result)
+            print(f"{self.PortName}: {tx_rx_res}")
+            raise CommError(f"{self.PortName}: {tx_rx_res}")
+
+        return dxl_data_list
+
+# port name -> opened bus
+BUSES: Dict[str, Bus] = {}
+BUS_EXECUTOR: ThreadPoolExecutor = None
+
+# motor id -> [model number, firmware version] and bus reported by the last broadcast ping
+DETECTED_MOTORS: Dict[int, List[int]] = {}
+DETECTED_MOTOR_BUSES: Dict[int, Bus] = {}
+
+def open_ports():
+    '''
+    open the ports in GlobalCommConfig and GlobalMotorsConfig, a port already open with the same baudrate is kept
+    open so re-running the setup does not reset the USB adapter
+    '''
+    global BUS_EXECUTOR
+    port_configs = get_port_configs()
+    for port_name, bus in list(BUSES.items()):
+        if port_configs.get(port_name) != bus.Baudrate or not bus.PortHandler.is_open:
+            bus.close()
+            del BUSES[port_name]
+
+    for port_name, baudrate in port_configs.items():
+        if port_name in BUSES:
+            print(f"Port {port_name} kept open at {baudrate}")
+            continue
+
+        bus = Bus(port_name, baudrate)
+        try:
+            bus.open()
+        except CommError as e:
+            # the motors on the other ports stay usable
+            print(e)
+            bus.close()
+            continue
+        BUSES[port_name] = bus
+
+    if BUS_EXECUTOR is not None:
+        BUS_EXECUTOR.shutdown(wait=True)
+        BUS_EXECUTOR = None
+
+    if len(BUSES) > 1:
+        BUS_EXECUTOR = ThreadPoolExecutor(max_workers=len(BUSES), thread_name_prefix='DynamixelPort')
+
+def close_ports():
+    global BUS_EXECUTOR
+    if BUS_EXECUTOR is not None:
+        BUS_EXECUTOR.shutdown(wait=True)
+        BUS_EXECUTOR = None
+
+    for bus in BUSES.values():
+        bus.close()
+    BUSES.clear()
+
+def get_motor_bus(motor_id: int) -> Bus:
+    '''
+    bus the motor answered on, the configured one when it was not detected
+    '''
+    if motor_id in DETECTED_MOTOR_BUSES:
+        return DETECTED_MOTOR_BUSES[motor_id]
+
+    ensure_motor_index()
+    port_name = MOTOR_PORT_INDEX.get(motor_id, (get_port_name(), 0))[0]
+    return BUSES.get(port_name)
+
+def group_by_bus(motors: List[Motor]) -> List[Tuple[List[Motor], List[int]]]:
+    '''
+    split motors per bus, every group keeps the motors order and their indexes in motors
+    '''
+    groups = {}
+    for index, motor in enumerate(motors):
+        bus_motors, indexes = groups.setdefault(motor.Bus, ([], []))
+        bus_motors.append(motor)
+        indexes.append(index)
+
+    return list(groups.values())
+
+def run_on_buses(calls: list) -> list:
+    '''
+    calls is a list of (function, args) each using a single bus, they run concurrently (the serial
+    reads release the GIL) and the results are returned in the same order
+    '''
+    if len(calls) == 1 or BUS_EXECUTOR is None:
+        return [function(*args) for function, args in calls]
+
+    futures = [BUS_EXECUTOR.submit(function, *args) for function, args in calls]
+    # let every bus finish before raising so no transaction outlives the caller's lock
+    wait(futures)
+
+    return [future.result() for future in futures]
+
+def merge_results(results: List[dict]) -> dict:
+    merged = {}
+    for result in results:
+        merged.update(result)
+
+    return merged
 
 def test_reading_configs():
     print(f"port: {get_port_name()}")
@@ -127,49 +586,516 @@ def test_reading_configs():
     print(f"\nnumber of motors from GlobalMotorsConfig: {get_motor_num_from_config()}")
 
 def test_broadcast_ping():
-    dxl_data_list, dxl_comm_result = PACKET_HANDLER.broadcastPing(PORT_HANDLER)
+    for bus in BUSES.values():
+        dxl_data_list = bus.broadcast_ping()
 
-    if dxl_comm_result != COMM_SUCCESS:
-        tx_rx_res = PACKET_HANDLER.getTxRxResult(dxl_comm_result)
-        print(f"{tx_rx_res}")
-        raise CommError(tx_rx_res)
-
-    print("Detected Dynamixel: ")
-    for dxl_id in dxl_data_list:
-        print(f"[ID: {dxl_id}] model version: {dxl_data_list.get(dxl_id)[0]} | firmware version: {dxl_data_list.get(dxl_id)[1]}")
+        print(f"Detected Dynamixel on {bus.PortName}: ")
+        for dxl_id in dxl_data_list:
+            print(f"[ID: {dxl_id}] model version: {dxl_data_list.get(dxl_id)[0]} | firmware version: {dxl_data_list.get(dxl_id)[1]}")
 
 def broadcast_ping() -> List[int]:
     '''
-    run broadcast ping to find all connected motors on the port
+    run broadcast ping on every port at the same time to find all connected motors
     '''
-    dxl_data_list, dxl_comm_result = PACKET_HANDLER.broadcastPing(PORT_HANDLER)
+    return discover_motors({})
 
-    if dxl_comm_result != COMM_SUCCESS:
-        tx_rx_res = PACKET_HANDLER.getTxRxResult(dxl_comm_result)
-        print(f"{tx_rx_res}")
-        raise CommError(tx_rx_res)
+def discover_motors(topology: dict) -> List[int]:
+    '''
+    find the connected motors on every port at the same time, a port listed in topology is only
+    checked against it and broadcast pinged when it does not match
+    '''
+    buses = list(BUSES.values())
+    results = run_on_buses([(discover_bus, (bus, topology.get(bus.PortName))) for bus in buses])
 
     motors_id = []
-    for dxl_id in dxl_data_list:
-        motors_id.append(dxl_id)
+    DETECTED_MOTORS.clear()
+    DETECTED_MOTOR_BUSES.clear()
+    # new motors or firmware may support what the previous ones did not
+    FAST_SYNC_READ_UNSUPPORTED.clear()
+    for bus, dxl_data_list in zip(buses, results):
+        for dxl_id in dxl_data_list:
+            if dxl_id in DETECTED_MOTOR_BUSES:
+                raise CommError(f"ID {dxl_id} answered on {DETECTED_MOTOR_BUSES[dxl_id].PortName} and {bus.PortName}, motor ids must be unique")
+
+            motors_id.append(dxl_id)
+            DETECTED_MOTORS[dxl_id] = dxl_data_list.get(dxl_id)
+            DETECTED_MOTOR_BUSES[dxl_id] = bus
 
     for motor_id in motors_id:
         RAM_TABLE.appendRow([motor_id])
         EEPROM_TABLE.appendRow([motor_id])
+        MOTOR_ROW_INDEX[motor_id] = RAM_TABLE.numRows - 1
 
     return motors_id
 
-def dummy_broadcast_ping() -> List[int]:
+################################################################################################################################
+'''
+Topology Cache
+A broadcast ping waits for every possible id to answer, the motors found last time are stored per port and
+only their model numbers are read back on the next setup. Any difference falls back to a broadcast ping.
+Motors added to a bus are found once the cache misses, or with the Use Cached Topology toggle off.
+'''
+################################################################################################################################
+
+DEFAULT_TOPOLOGY_FILE = 'dynamixel_topology.json'
+# Model Number is at the same address on every protocol 2.0 model
+MODEL_NUMBER_ADDRESS = 0
+MODEL_NUMBER_SIZE = 2
+
+def load_topology(path: str) -> dict:
     '''
-    Broadcast ping simulation for getting number of connected motors and ther id's
+    port name -> {'baudrate': baudrate, 'motors': {motor id: [model number, firmware version]}}
     '''
-    motors_id = [1, 2]
-
+    try:
+        with open(path) as file:
+            saved = json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+    topology = {}
+    for port_name, port in saved.get('ports', {}).items():
+        motors = {int(motor_id): list(data) for motor_id, data in port.get('motors', {}).items()}
+        topology[port_name] = {'baudrate': port.get('baudrate'), 'motors': motors}
+
+    return topology
+
+def save_topology(path: str):
+    ports = {bus.PortName: {'baudrate': bus.Baudrate, 'motors': {}} for bus in BUSES.values()}
+    for motor_id, bus in DETECTED_MOTOR_BUSES.items():
+        ports[bus.PortName]['motors'][str(motor_id)] = DETECTED_MOTORS[motor_id]
+
+    try:
+        with open(path, 'w') as file:
+            json.dump({'saved': datetime.now().isoformat(timespec='seconds'), 'ports': ports}, file, indent=2)
+    except OSError as error:
+        print(f"Topology not saved to {path}: {error}")
+
+def read_model_numbers(bus: Bus, motors_id: List[int]) -> Dict[int, int]:
+    '''
+    model number of every motor that answered a single sync read, empty when the transaction failed
+    '''
+    group_sync_read = GroupSyncRead(bus.PortHandler, PACKET_HANDLER, MODEL_NUMBER_ADDRESS, MODEL_NUMBER_SIZE)
     for motor_id in motors_id:
-        RAM_TABLE.appendRow([motor_id])
-        EEPROM_TABLE.appendRow([motor_id])
+        group_sync_read.addParam(motor_id)
 
-    return motors_id
+    start = time.perf_counter()
+    dxl_comm_result = group_sync_read.txRxPacket()
+    BUS_STATS.record('sync_read', start, dxl_comm_result)
+    if dxl_comm_result != COMM_SUCCESS:
+        return {}
+
+    return {motor_id: group_sync_read.getData(motor_id, MODEL_NUMBER_ADDRESS, MODEL_NUMBER_SIZE)
+            for motor_id in motors_id if group_sync_read.isAvailable(motor_id, MODEL_NUMBER_ADDRESS, MODEL_NUMBER_SIZE)}
+
+def discover_bus(bus: Bus, cached_port: dict = None) -> dict:
+    '''
+    motor id -> [model number, firmware version] on the bus, the cached motors when every one of them still
+    answers with its model number, a broadcast ping otherwise
+    '''
+    if cached_port and cached_port['motors'] and cached_port['baudrate'] == bus.Baudrate:
+        cached = cached_port['motors']
+        model_numbers = read_model_numbers(bus, list(cached))
+        if all(model_numbers.get(motor_id) == data[0] for motor_id, data in cached.items()):
+            print(f"{bus.PortName}: cached topology confirmed {list(cached)}")
+            return cached
+
+        print(f"{bus.PortName}: cached topology does not match, broadcast ping")
+
+    try:
+        return bus.broadcast_ping()
+    except CommError:
+        # broadcast_ping printed why, a port without answering motors must not abort the setup of the others
+        return {}
+
+################################################################################################################################
+'''
+Bus Statistics
+Every bus transaction is timed into a fixed size log histogram per transaction kind, cheap enough to stay on
+during a show. Percentiles are read back from the histogram (upper bin edge) so nothing grows with time.
+'''
+TRANSACTION_KINDS = ['sync_read', 'fast_sync_read', 'bulk_read', 'sync_write', 'bulk_write', 'txrx', 'ping']
+
+# 10 bins per decade from 10us to 1s, one more bin for slower transactions
+LATENCY_MIN_S = 1e-5
+LATENCY_BINS_PER_DECADE = 10
+LATENCY_BIN_NUM = 5 * LATENCY_BINS_PER_DECADE + 1
+LATENCY_BIN_EDGES_MS = [LATENCY_MIN_S * 1000.0 * 10 ** ((i + 1) / LATENCY_BINS_PER_DECADE) for i in range(LATENCY_BIN_NUM)]
+STATS_PERCENTILES = [50, 95, 99]
+
+class TransactionStats:
+    def __init__(self) -> None:
+        self.Count = 0
+        self.Errors = 0
+        self.ErrorCodes: Dict[int, int] = {}
+        self.PacketErrors = 0
+        self.Histogram = [0] * LATENCY_BIN_NUM
+
+    def percentile(self, percentile: float) -> float:
+        '''
+        latency in ms below which percentile % of the transactions finished
+        '''
+        if self.Count == 0:
+            return 0.0
+
+        rank = self.Count * percentile / 100.0
+        cumulative = 0
+        for edge, count in zip(LATENCY_BIN_EDGES_MS, self.Histogram):
+            cumulative += count
+            if cumulative >= rank:
+                return edge
+
+        return LATENCY_BIN_EDGES_MS[-1]
+
+class BusStats:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.Kinds = {kind: TransactionStats() for kind in TRANSACTION_KINDS}
+
+    def record(self, kind: str, start: float, comm_result: int, error: int = 0):
+        '''
+        start is the time.perf_counter() taken right before the transaction
+        '''
+        latency = time.perf_counter() - start
+        if latency > LATENCY_MIN_S:
+            index = min(int(math.log10(latency / LATENCY_MIN_S) * LATENCY_BINS_PER_DECADE), LATENCY_BIN_NUM - 1)
+        else:
+            index = 0
+
+        with self._lock:
+            stats = self.Kinds[kind]
+            stats.Count += 1
+            stats.Histogram[index] += 1
+            if comm_result != COMM_SUCCESS:
+                stats.Errors += 1
+                stats.ErrorCodes[comm_result] = stats.ErrorCodes.get(comm_result, 0) + 1
+            elif error != 0:
+                stats.PacketErrors += 1
+
+    def reset(self):
+        with self._lock:
+            self.Kinds = {kind: TransactionStats() for kind in TRANSACTION_KINDS}
+
+    def get_channels(self) -> List[Tuple[str, float]]:
+        channels = []
+        with self._lock:
+            for kind, stats in self.Kinds.items():
+                channels.append((f'{kind}_count', stats.Count))
+                channels.append((f'{kind}_errors', stats.Errors))
+                for percentile in STATS_PERCENTILES:
+                    channels.append((f'{kind}_p{percentile}_ms', stats.percentile(percentile)))
+
+        return channels
+
+    def get_messages(self) -> List[str]:
+        messages = []
+        with self._lock:
+            for kind, stats in self.Kinds.items():
+                if stats.Count == 0:
+                    continue
+                percentiles = ' '.join(f'p{percentile} {stats.percentile(percentile):.3f} ms' for percentile in STATS_PERCENTILES)
+                messages.append(f"{kind}: count {stats.Count} errors {stats.Errors} packet errors {stats.PacketErrors} {percentiles}")
+                for comm_result, count in stats.ErrorCodes.items():
+                    messages.append(f"{kind}: {PACKET_HANDLER.getTxRxResult(comm_result)} x{count}")
+
+        return messages
+
+BUS_STATS = BusStats()
+
+def publish_bus_stats(script_op):
+    # one sample per motor in the channels output mode, every sample carries the value
+    for name, value in BUS_STATS.get_channels():
+        script_op.appendChan(name).vals = [value] * script_op.numSamples
+
+################################################################################################################################
+'''
+Transaction Plans
+GroupSyncRead/GroupBulkRead/GroupBulkWrite objects are kept per register and selected motor set, so addParam
+only runs when the selection changes and every cook only refreshes the data payload
+'''
+MAX_CACHED_PLANS = 64
+
+# Fast Sync Read (all motors answer in one status packet) needs Protocol 2.0, X/MX firmware v45 or above
+# and an SDK release that has GroupSyncRead.fastSyncRead
+FAST_SYNC_READ_MOTOR_TYPES = ['X_SERIES', 'MX_SERIES']
+FAST_SYNC_READ_MIN_FIRMWARE = 45
+
+# the one status packet holds id, error and crc besides the data of every motor
+FAST_SYNC_READ_HEADER_LENGTH = 11
+FAST_SYNC_READ_MOTOR_OVERHEAD = 4
+
+# motors whose Fast Sync Read failed FAST_SYNC_READ_MAX_FAILURES times in a row while the regular sync read
+# answered, not tried again until the motors are discovered again
+FAST_SYNC_READ_MAX_FAILURES = 3
+FAST_SYNC_READ_UNSUPPORTED = set()
+
+def supports_fast_sync_read(motor: Motor) -> bool:
+    return motor.Type in FAST_SYNC_READ_MOTOR_TYPES and \
+           motor.Firmware >= FAST_SYNC_READ_MIN_FIRMWARE and \
+           motor.ID not in FAST_SYNC_READ_UNSUPPORTED
+
+def to_param_bytes(value: int, data_size: int) -> List[int]:
+    if data_size == 1:
+        return [DXL_LOBYTE(value)]
+    elif data_size == 2:
+        return [DXL_LOBYTE(value), DXL_HIBYTE(value)]
+
+    return [DXL_LOBYTE(DXL_LOWORD(value)),
+            DXL_HIBYTE(DXL_LOWORD(value)),
+            DXL_LOBYTE(DXL_HIWORD(value)),
+            DXL_HIBYTE(DXL_HIWORD(value))]
+
+class ReadPlan:
+    '''
+    motors must share one bus, see group_by_bus
+    '''
+    def __init__(self, motors: List[Motor], register: str) -> None:
+        self.Motors = motors
+        self.Register = register
+        port_handler = motors[0].Bus.PortHandler
+
+        # sync read when every motor shares the same address and size, bulk read for mixed control tables
+        items = [getattr(motor.ControlTable, register) for motor in motors]
+        self.IsSync = all(item.Address == items[0].Address and item.DataSize == items[0].DataSize for item in items)
+
+        if self.IsSync:
+            self.Group = GroupSyncRead(port_handler, PACKET_HANDLER, items[0].Address, items[0].DataSize)
+        else:
+            self.Group = GroupBulkRead(port_handler, PACKET_HANDLER)
+
+        self.Result = COMM_SUCCESS
+        self.FastFailures = 0
+        self.IsFast = self.IsSync and PACKET_HANDLER.getProtocolVersion() == 2.0 and hasattr(self.Group, 'fastSyncRead') and \
+                      all(supports_fast_sync_read(motor) for motor in motors) and \
+                      FAST_SYNC_READ_HEADER_LENGTH + len(motors) * (items[0].DataSize + FAST_SYNC_READ_MOTOR_OVERHEAD) <= RXPACKET_MAX_LEN
+
+        for motor, item in zip(motors, items):
+            if self.IsSync:
+                addparam_result = self.Group.addParam(motor.ID)
+            else:
+                addparam_result = self.Group.addParam(motor.ID, item.Address, item.DataSize)
+
+            if addparam_result != True:
+                raise CommError(f"[ID:{motor.ID}] groupRead addParam {register} failed")
+
+    def txrx(self, fast: bool = True):
+        '''
+        fast=False skips the Fast Sync Read, only a failed regular read tells which motors answered (get_answered)
+        '''
+        fast = fast and self.IsFast
+        if fast:
+            start = time.perf_counter()
+            comm_result = self.Result = self.Group.fastSyncRead()
+            BUS_STATS.record('fast_sync_read', start, comm_result)
+            if comm_result == COMM_SUCCESS:
+                self.FastFailures = 0
+                return
+
+        start = time.perf_counter()
+        comm_result = self.Result = self.Group.txRxPacket()
+        BUS_STATS.record('sync_read' if self.IsSync else 'bulk_read', start, comm_result)
+        if comm_result != COMM_SUCCESS:
+            raise CommError(f"{PACKET_HANDLER.getTxRxResult(comm_result)}")
+
+        if fast:
+            # the motors answer a regular sync read but not the fast one, a single dropped frame does not count
+            self.FastFailures += 1
+            if self.FastFailures >= FAST_SYNC_READ_MAX_FAILURES:
+                print(f"Fast Sync Read failed for motors {[motor.ID for motor in self.Motors]}, using Sync Read instead")
+                FAST_SYNC_READ_UNSUPPORTED.update(motor.ID for motor in self.Motors)
+                self.IsFast = False
+
+    def get_value(self, motor: Motor) -> int:
+        item = getattr(motor.ControlTable, self.Register)
+        if self.Group.isAvailable(motor.ID, item.Address, item.DataSize) != True:
+            raise CommError(f"[ID:{motor.ID}] groupRead getdata {self.Register} failed")
+
+        value = self.Group.getData(motor.ID, item.Address, item.DataSize)
+
+        # the SDK always returns the unsigned value
+        if item.Signed and value >= 1 << (8 * item.DataSize - 1):
+            value -= 1 << (8 * item.DataSize)
+
+        return value
+
+    def get_block(self, motor: Motor) -> bytes:
+        '''
+        raw bytes received for the motor, the SDK getters only decode a single 1, 2 or 4 byte item
+        '''
+        item = getattr(motor.ControlTable, self.Register)
+        if self.Group.isAvailable(motor.ID, item.Address, item.DataSize) != True:
+            raise CommError(f"[ID:{motor.ID}] groupRead getdata {self.Register} failed")
+
+        data = self.Group.data_dict[motor.ID]
+        if not self.IsSync:
+            data = data[0]
+
+        if len(data) != item.DataSize:
+            raise CommError(f"[ID:{motor.ID}] groupRead {self.Register} returned {len(data)} of {item.DataSize} bytes")
+
+        return bytes(data)
+
+    def get_answered(self) -> Dict[int, bytes]:
+        '''
+        raw bytes of the motors that answered a failed txrx. The SDK reads the status packets in motor order
+        and stops at the first one missing, whose data it leaves empty, every motor before it was read
+        '''
+        answered = {}
+        if self.Result == COMM_SUCCESS:
+            return answered
+
+        for motor in self.Motors:
+            data = self.Group.data_dict[motor.ID]
+            if not self.IsSync:
+                data = data[0]
+            if not data:
+                break
+            answered[motor.ID] = bytes(data)
+
+        return answered
+
+class WritePlan:
+    '''
+    GroupBulkWrite parameters, split into several groups when the motors do not fit one instruction packet
+    (5 + DataSize bytes per motor, kept below the SDK limit like split_write_batches)
+    '''
+    def __init__(self, motors: List[Motor], register: str) -> None:
+        self.Motors = motors
+        self.Register = register
+        self.Groups = []
+        self.MotorGroups = {}
+
+        length = TXPACKET_MAX_LEN
+        for motor in motors:
+            item = getattr(motor.ControlTable, register)
+            if length + 5 + item.DataSize > TXPACKET_MAX_LEN // 2:
+                self.Groups.append(GroupBulkWrite(motors[0].Bus.PortHandler, PACKET_HANDLER))
+                length = 0
+            length += 5 + item.DataSize
+
+            self.MotorGroups[motor.ID] = self.Groups[-1]
+            addparam_result = self.Groups[-1].addParam(motor.ID, item.Address, item.DataSize, [0] * item.DataSize)
+
+            if addparam_result != True:
+                raise CommError(f"[ID:{motor.ID}] groupBulkWrite addParam {register} failed")
+
+    def set_value(self, motor: Motor, value: int):
+        item = getattr(motor.ControlTable, self.Register)
+        check_register_values([motor], self.Register, item, [value])
+        self.MotorGroups[motor.ID].changeParam(motor.ID, item.Address, item.DataSize, to_param_bytes(value, item.DataSize))
+
+    def set_bytes(self, motor: Motor, data: bytes):
+        item = getattr(motor.ControlTable, self.Register)
+        self.MotorGroups[motor.ID].changeParam(motor.ID, item.Address, item.DataSize, list(data))
+
+    def tx(self):
+        for group in self.Groups:
+            tx_bulk_write(group)
+
+def check_register_values(motors: List[Motor], register: str, item: ControlData, values):
+    '''
+    raise GoalInputError when a value does not fit item, the packed bytes would silently wrap around
+    '''
+    low, high = item.get_range()
+    values = np.asarray(values, dtype=np.float64)
+    # NaN fails both comparisons and is rejected too
+    invalid = ~((values >= low) & (values <= high))
+    if invalid.any():
+        bad = [f"MotorID {motor.ID}: {int(value) if math.isfinite(value) else value}" for motor, value, is_invalid in zip(motors, values, invalid) if is_invalid]
+        raise GoalInputError(f"{register} must be between {low} and {high}, got {', '.join(bad)}")
+
+# numpy dtype of one GroupSyncWrite parameter entry (motor id followed by little endian data) per data size and signedness
+SYNC_WRITE_DTYPES = {
+    (1, False): np.dtype([('id', 'u1'), ('data', 'u1')]),
+    (1, True) : np.dtype([('id', 'u1'), ('data', 'i1')]),
+    (2, False): np.dtype([('id', 'u1'), ('data', '<u2')]),
+    (2, True) : np.dtype([('id', 'u1'), ('data', '<i2')]),
+    (4, False): np.dtype([('id', 'u1'), ('data', '<u4')]),
+    (4, True) : np.dtype([('id', 'u1'), ('data', '<i4')])
+}
+
+class SyncWritePlan:
+    '''
+    GroupSyncWrite parameters for motors sharing the register address, kept as one contiguous buffer
+    so the goals of all motors are packed with a single array copy
+    '''
+    def __init__(self, motors: List[Motor], register: str) -> None:
+        self.Motors = motors
+        self.Register = register
+        self.PortHandler = motors[0].Bus.PortHandler
+        self.Item = getattr(motors[0].ControlTable, register)
+        self.Buffer = np.zeros(len(motors), dtype=SYNC_WRITE_DTYPES[(self.Item.DataSize, self.Item.Signed)])
+        self.Buffer['id'] = [motor.ID for motor in motors]
+        # entries per instruction packet, 1 + DataSize bytes each below the SDK limit like split_write_batches
+        self.PacketEntries = (TXPACKET_MAX_LEN // 2) // self.Buffer.itemsize
+
+    def set_values(self, values):
+        values = np.rint(values)
+        check_register_values(self.Motors, self.Register, self.Item, values)
+        self.Buffer['data'] = values
+
+    def tx(self, mask=None):
+        '''
+        mask selects the motors to send, the other entries are left out of the packet. More motors than
+        PacketEntries go out in several packets
+        '''
+        entries = self.Buffer if mask is None else self.Buffer[mask]
+        for index in range(0, len(entries), self.PacketEntries):
+            param = entries[index:index + self.PacketEntries].tobytes()
+            start = time.perf_counter()
+            comm_result = PACKET_HANDLER.syncWriteTxOnly(self.PortHandler, self.Item.Address, self.Item.DataSize, param, len(param))
+            BUS_STATS.record('sync_write', start, comm_result)
+            if comm_result != COMM_SUCCESS:
+                raise CommError(f"{PACKET_HANDLER.getTxRxResult(comm_result)}")
+
+READ_PLANS = {}
+WRITE_PLANS = {}
+SYNC_WRITE_PLANS = {}
+
+def get_plan(plans: dict, plan_class, motors: List[Motor], register: str):
+    key = (register, tuple(motor.ID for motor in motors))
+    plan = plans.get(key)
+    if plan is None:
+        if len(plans) >= MAX_CACHED_PLANS:
+            plans.clear()
+        plan = plans[key] = plan_class(motors, register)
+
+    return plan
+
+def get_read_plan(motors: List[Motor], register: str) -> ReadPlan:
+    return get_plan(READ_PLANS, ReadPlan, motors, register)
+
+def get_write_plan(motors: List[Motor], register: str) -> WritePlan:
+    return get_plan(WRITE_PLANS, WritePlan, motors, register)
+
+def get_sync_write_plan(motors: List[Motor], register: str) -> SyncWritePlan:
+    return get_plan(SYNC_WRITE_PLANS, SyncWritePlan, motors, register)
+
+def clear_transaction_plans():
+    READ_PLANS.clear()
+    WRITE_PLANS.clear()
+    SYNC_WRITE_PLANS.clear()
+
+# last goal sent per register, indexed by motor id, NaN until the first write
+MAX_MOTOR_ID = 252
+DEFAULT_GOAL_DEADBAND = 0.0
+GOAL_SHADOW: Dict[str, np.ndarray] = {}
+
+def get_goal_shadow(register: str) -> np.ndarray:
+    if register not in GOAL_SHADOW:
+        GOAL_SHADOW[register] = np.full(MAX_MOTOR_ID + 1, np.nan)
+
+    return GOAL_SHADOW[register]
+
+def invalidate_goal_shadow(motors_id: List[int] = None):
+    '''
+    the next write resends the goals of motors_id (all motors when None), used when the motor may have
+    changed its goal on its own (torque, operating mode, re-detection)
+    '''
+    for shadow in GOAL_SHADOW.values():
+        if motors_id is None:
+            shadow[:] = np.nan
+        else:
+            shadow[motors_id] = np.nan
 
 ################################################################################################################################
 # Global variable for defining button name, it should start with capital letter
@@ -183,13 +1109,77 @@ READ_TORQUE = 'Readtorque'
 READ_CURRENT_POSITION = 'Readposition'
 WRITE_GOAL_POSITION = 'Writegoalposition'
 WRITE_GOAL_VELOCITY = 'Writegoalvelocity'
+READ_PRESENT_STATE = 'Readpresentstate'
+COOK_READ_MODE = 'Cookreadmode'
+COOK_WRITE_MODE = 'Cookwritemode'
+GOAL_SOURCE = 'Goalsource'
+BUS_THREAD_ENABLE = 'Busthread'
+BUS_RATE = 'Busrate'
+GOAL_DEADBAND = 'Goaldeadband'
+BENCHMARK_BUS = 'Benchmarkbus'
+TUNE_BAUD_RATES = 'Tunebaudrates'
+APPLY_TUNING = 'Applytuning'
+BENCHMARK_FILE = 'Benchmarkfile'
+PUBLISH_BUS_STATS = 'Busstats'
+SHOW_BUS_STATS = 'Showbusstats'
+RESET_BUS_STATS = 'Resetbusstats'
+USE_CACHED_TOPOLOGY = 'Cachedtopology'
+TOPOLOGY_FILE = 'Topologyfile'
+OUTPUT_MODE = 'Outputmode'
+TABLE_MIRROR_RATE = 'Tablemirrorrate'
+INDIRECT_REGISTERS = 'Indirectregisters'
+TOLERATE_FAULTS = 'Toleratefaults'
+RETRY_BUDGET = 'Retrybudget'
+TRAJECTORY_SOURCE = 'Trajectorysource'
+TRAJECTORY_FILE = 'Trajectoryfile'
+TRAJECTORY_CHOP = 'Trajectorychop'
+TRAJECTORY_REGISTER = 'Trajectoryregister'
+LOOP_TRAJECTORY = 'Looptrajectory'
+PLAY_TRAJECTORY = 'Playtrajectory'
+STOP_TRAJECTORY = 'Stoptrajectory'
+RECORD = 'Record'
+RECORD_FOLDER = 'Recordfolder'
+RECORD_LENGTH = 'Recordlength'
+RECORD_FILES = 'Recordfiles'
+REPLAY_FILE = 'Replayfile'
+REPLAY_SPEED = 'Replayspeed'
+REPLAY_SEEK = 'Replayseek'
+LOOP_REPLAY = 'Loopreplay'
+PLAY_REPLAY = 'Playreplay'
+SEEK_REPLAY = 'Seekreplay'
+STOP_REPLAY = 'Stopreplay'
+
+# Menu entries for COOK_READ_MODE, what onCook reads from the motors every cook
+COOK_READ_POSITION = 'position'
+COOK_READ_STATE = 'state'
+COOK_READ_INDIRECT = 'indirect'
+
+# Menu entries for COOK_WRITE_MODE, which goals onCook sends from the RAM table every cook
+COOK_WRITE_NONE = 'none'
+COOK_WRITE_GOAL_POSITION = 'goalposition'
+COOK_WRITE_GOAL_VELOCITY = 'goalvelocity'
+
+# Menu entries for OUTPUT_MODE, where onCook puts the values read from the motors
+OUTPUT_TABLE = 'table'
+OUTPUT_CHANNELS = 'channels'
+
+# Menu entries for GOAL_SOURCE, where the cook goals come from
+GOAL_SOURCE_TABLE = 'table'
+GOAL_SOURCE_INPUT = 'input'
 
 MOTORS: List[Motor] = []
 
-CONTROLLER_OP = op('DynamixelController')
-RAM_TABLE = op('DynamixelMotorsRAM')
-EEPROM_TABLE = op('DynamixelMotorsEEPROM')
-DEBUG_TABLE = op('Debug')
+# motor id -> row in DynamixelMotorsRAM and DynamixelMotorsEEPROM (both tables share the row order)
+MOTOR_ROW_INDEX: Dict[int, int] = {}
+
+CONTROLLER_OP = Lazy(lambda: op('DynamixelController'))
+RAM_TABLE = Lazy(lambda: op('DynamixelMotorsRAM'))
+EEPROM_TABLE = Lazy(lambda: op('DynamixelMotorsEEPROM'))
+DEBUG_TABLE = Lazy(lambda: op('Debug'))
+
+# looked up again by every setup
+LAZY_OPERATORS = [GLOBAL_COMM_CONFIG, GLOBAL_MOTORS_CONFIG, CONTROL_TABLES_CONFIG, PACKET_HANDLER, CONTROLLER_OP, RAM_TABLE,
+                  EEPROM_TABLE, DEBUG_TABLE]
 
 # Dictionary for holding Row index and variable name
 class EEPROM(Enum):
@@ -271,6 +1261,9 @@ class RAM(Enum):
     PRESENT_INPUT_VOLTAGE       = 28
     PRESENT_TEMPERATURE         = 29
     BACKUP_READY                = 30
+    STALE                       = 31
+    STALE_AGE                   = 32
+    ERROR_CODE                  = 33
 
 RAM_ROW_NAME_DICT = {
     RAM.ID                          : "ID",
@@ -303,7 +1296,87 @@ RAM_ROW_NAME_DICT = {
     RAM.POSITION_TRAJECTORY         : "Position Trajectory",
     RAM.PRESENT_INPUT_VOLTAGE       : "Present Input Voltage",
     RAM.PRESENT_TEMPERATURE         : "Present Temperature",
-    RAM.BACKUP_READY                : "Backup Ready"
+    RAM.BACKUP_READY                : "Backup Ready",
+    RAM.STALE                       : "Stale",
+    RAM.STALE_AGE                   : "Stale Age",
+    RAM.ERROR_CODE                  : "Error Code"
+}
+
+# EEPROM rows decoded from ControlTable.EEPROMArea with the ControlTable attribute name,
+# the ID column is the motor lookup key and is not overwritten
+EEPROM_FIELDS = [
+    (EEPROM.MODEL_NUMBER,          'ModelNumber'),
+    (EEPROM.MODEL_INFORMATION,     'ModelInformation'),
+    (EEPROM.FIRMWARE_VERSION,      'FirmwareVersion'),
+    (EEPROM.BAUD_RATE,             'BaudRate'),
+    (EEPROM.RETURN_DELAY_TIME,     'ReturnDelayTime'),
+    (EEPROM.DRIVE_MODE,            'DriveMode'),
+    (EEPROM.OPERATING_MODE,        'OperatingMode'),
+    (EEPROM.SECONDARY_SHADOW_ID,   'SecondaryID'),
+    (EEPROM.PROTOCOL_TYPE,         'ProtocolType'),
+    (EEPROM.HOMING_OFFSET,         'HomingOffset'),
+    (EEPROM.MOVING_THRESHOLD,      'MovingThreshold'),
+    (EEPROM.TEMPERATURE_LIMIT,     'TemperatureLimit'),
+    (EEPROM.MAX_VOLTAGE_LIMIT,     'MaxVoltageLimit'),
+    (EEPROM.MIN_VOLTAGE_LIMIT,     'MinVoltageLimit'),
+    (EEPROM.PWM_LIMIT,             'PWMLimit'),
+    (EEPROM.VELOCITY_LIMIT,        'VelocityLimit'),
+    (EEPROM.MAX_POSITION_LIMIT,    'MaxPositionLimit'),
+    (EEPROM.MIN_POSITION_LIMIT,    'MinPositionLimit'),
+    (EEPROM.STARTUP_CONFIGURATION, 'StartupConfiguration'),
+    (EEPROM.SHUTDOWN,              'Shutdown')
+]
+
+# RAM rows decoded from ControlTable.RAMArea with the ControlTable attribute name
+RAM_FIELDS = [
+    (RAM.TORQUE,                    'Torque'),
+    (RAM.LED,                       'LED'),
+    (RAM.STATUS_RETURN_LEVEL,       'StatusReturnLevel'),
+    (RAM.REGISTERED_INSTRUCTION,    'RegisteredInstruction'),
+    (RAM.HARDWARE_ERROR_STATUS,     'HardwareErrorStatus'),
+    (RAM.VELOCITY_I_GAIN,           'VelocityIGain'),
+    (RAM.VELOCITY_P_GAIN,           'VelocityPGain'),
+    (RAM.POSITION_D_GAIN,           'PositionDGain'),
+    (RAM.POSITION_I_GAIN,           'PositionIGain'),
+    (RAM.POSITION_P_GAIN,           'PositionPGain'),
+    (RAM.FEEDFORWARD_2ND_GAIN,      'Feedforward2ndGain'),
+    (RAM.FEEDFORWARD_1ST_GAIN,      'Feedforward1stGain'),
+    (RAM.BUS_WATCHDOG,              'BusWatchdog'),
+    (RAM.GOAL_PWM,                  'GoalPWM'),
+    (RAM.GOAL_VELOCITY,             'GoalVelocity'),
+    (RAM.PROFILE_ACCELERATION,      'ProfileAcceleration'),
+    (RAM.PROFILE_VELOCITY,          'ProfileVelocity'),
+    (RAM.GOAL_POSITION,             'GoalPosition'),
+    (RAM.REALTIME_TICK,             'RealtimeTick'),
+    (RAM.MOVING,                    'Moving'),
+    (RAM.MOVING_STATUS,             'MovingStatus'),
+    (RAM.PRESENT_PWM,               'PresentPWM'),
+    (RAM.PRESENT_LOAD,              'PresentLoad'),
+    (RAM.PRESENT_VELOCITY,          'PresentVelocity'),
+    (RAM.PRESENT_POSITION,          'PresentPosition'),
+    (RAM.VELOCITY_TRAJECTORY,       'VelocityTrajectory'),
+    (RAM.POSITION_TRAJECTORY,       'PositionTrajectory'),
+    (RAM.PRESENT_INPUT_VOLTAGE,     'PresentInputVoltage'),
+    (RAM.PRESENT_TEMPERATURE,       'PresentTemperature'),
+    (RAM.BACKUP_READY,              'BackupReady')
+]
+
+# RAM rows decoded from ControlTable.PresentState with the ControlTable attribute name, block values follow this order
+PRESENT_STATE_FIELDS = [
+    (RAM.PRESENT_PWM,           'PresentPWM'),
+    (RAM.PRESENT_LOAD,          'PresentLoad'),
+    (RAM.PRESENT_VELOCITY,      'PresentVelocity'),
+    (RAM.PRESENT_POSITION,      'PresentPosition'),
+    (RAM.VELOCITY_TRAJECTORY,   'VelocityTrajectory'),
+    (RAM.POSITION_TRAJECTORY,   'PositionTrajectory'),
+    (RAM.PRESENT_INPUT_VOLTAGE, 'PresentInputVoltage'),
+    (RAM.PRESENT_TEMPERATURE,   'PresentTemperature')
+]
+
+# ControlTable attribute and RAM row written for each COOK_WRITE_MODE
+COOK_WRITE_REGISTERS = {
+    COOK_WRITE_GOAL_POSITION : ('GoalPosition', RAM.GOAL_POSITION),
+    COOK_WRITE_GOAL_VELOCITY : ('GoalVelocity', RAM.GOAL_VELOCITY)
 }
 
 def build_motors_selector_page(script_op):
@@ -331,17 +1404,113 @@ def build_position_page(script_op):
     page_position = script_op.appendCustomPage('Position')
     page_position.appendPulse(READ_CURRENT_POSITION, label='Read Current Position')
     page_position.appendPulse(WRITE_GOAL_POSITION, label='Write Goal Position')
+    page_position.appendPulse(READ_PRESENT_STATE, label='Read Present State')
 
 def build_velocity_page(script_op):
     page_velocity = script_op.appendCustomPage('Velocity')
     page_velocity.appendPulse(WRITE_GOAL_VELOCITY, label='Write Goal Velocity')
 
+def build_cook_page(script_op):
+    page_cook = script_op.appendCustomPage('Cook')
+    cook_read_mode = page_cook.appendMenu(COOK_READ_MODE, label='Cook Read Mode')[0]
+    cook_read_mode.menuNames = [COOK_READ_POSITION, COOK_READ_STATE, COOK_READ_INDIRECT]
+    cook_read_mode.menuLabels = ['Present Position', 'Present State (PWM to Temperature)', 'Indirect Registers']
+    cook_write_mode = page_cook.appendMenu(COOK_WRITE_MODE, label='Cook Write Mode')[0]
+    cook_write_mode.menuNames = [COOK_WRITE_NONE, COOK_WRITE_GOAL_POSITION, COOK_WRITE_GOAL_VELOCITY]
+    cook_write_mode.menuLabels = ['None', 'Goal Position', 'Goal Velocity']
+    goal_source = page_cook.appendMenu(GOAL_SOURCE, label='Goal Source')[0]
+    goal_source.menuNames = [GOAL_SOURCE_TABLE, GOAL_SOURCE_INPUT]
+    goal_source.menuLabels = ['RAM Table', 'CHOP Input (one channel per selected motor)']
+    page_cook.appendToggle(BUS_THREAD_ENABLE, label='Run Bus On Thread')
+    bus_rate = page_cook.appendFloat(BUS_RATE, label='Bus Rate (Hz)')[0]
+    bus_rate.default = DEFAULT_BUS_RATE
+    bus_rate.val = DEFAULT_BUS_RATE
+    goal_deadband = page_cook.appendFloat(GOAL_DEADBAND, label='Goal Deadband')[0]
+    goal_deadband.default = DEFAULT_GOAL_DEADBAND
+    goal_deadband.val = DEFAULT_GOAL_DEADBAND
+    output_mode = page_cook.appendMenu(OUTPUT_MODE, label='Output')[0]
+    output_mode.menuNames = [OUTPUT_TABLE, OUTPUT_CHANNELS]
+    output_mode.menuLabels = ['RAM Table', 'Channels (one sample per motor)']
+    table_mirror_rate = page_cook.appendFloat(TABLE_MIRROR_RATE, label='Table Mirror Rate (Hz)')[0]
+    table_mirror_rate.default = DEFAULT_TABLE_MIRROR_RATE
+    table_mirror_rate.val = DEFAULT_TABLE_MIRROR_RATE
+    page_cook.appendToggle(TOLERATE_FAULTS, label='Tolerate Motor Faults')
+    retry_budget = page_cook.appendFloat(RETRY_BUDGET, label='Retry Budget (ms)')[0]
+    retry_budget.default = DEFAULT_RETRY_BUDGET_MS
+    retry_budget.val = DEFAULT_RETRY_BUDGET_MS
+    indirect_registers = page_cook.appendStr(INDIRECT_REGISTERS, label='Indirect Registers')[0]
+    indirect_registers.default = DEFAULT_INDIRECT_REGISTERS
+    indirect_registers.val = ' '.join(INDIRECT_FIELDS_NAMES) or DEFAULT_INDIRECT_REGISTERS
+
+def build_trajectory_page(script_op):
+    page_trajectory = script_op.appendCustomPage('Trajectory')
+    trajectory_source = page_trajectory.appendMenu(TRAJECTORY_SOURCE, label='Trajectory Source')[0]
+    trajectory_source.menuNames = [TRAJECTORY_SOURCE_FILE, TRAJECTORY_SOURCE_CHOP]
+    trajectory_source.menuLabels = ['.npy File (time, goal per motor)', 'CHOP (channel per motor)']
+    page_trajectory.appendFile(TRAJECTORY_FILE, label='Trajectory File')
+    page_trajectory.appendCHOP(TRAJECTORY_CHOP, label='Trajectory CHOP')
+    trajectory_register = page_trajectory.appendMenu(TRAJECTORY_REGISTER, label='Trajectory Goal')[0]
+    trajectory_register.menuNames = [COOK_WRITE_GOAL_POSITION, COOK_WRITE_GOAL_VELOCITY]
+    trajectory_register.menuLabels = ['Goal Position', 'Goal Velocity']
+    page_trajectory.appendToggle(LOOP_TRAJECTORY, label='Loop')
+    page_trajectory.appendPulse(PLAY_TRAJECTORY, label='Play')
+    page_trajectory.appendPulse(STOP_TRAJECTORY, label='Stop')
+
+def build_record_page(script_op):
+    page_record = script_op.appendCustomPage('Record')
+    page_record.appendToggle(RECORD, label='Record')
+    record_folder = page_record.appendFolder(RECORD_FOLDER, label='Record Folder')[0]
+    record_folder.default = DEFAULT_RECORD_FOLDER
+    record_folder.val = DEFAULT_RECORD_FOLDER
+    record_length = page_record.appendInt(RECORD_LENGTH, label='Record Length (samples)')[0]
+    record_length.default = DEFAULT_RECORD_LENGTH
+    record_length.val = DEFAULT_RECORD_LENGTH
+    record_files = page_record.appendInt(RECORD_FILES, label='Record Files Kept')[0]
+    record_files.default = DEFAULT_RECORD_FILES
+    record_files.val = DEFAULT_RECORD_FILES
+
+def build_replay_page(script_op):
+    page_replay = script_op.appendCustomPage('Replay')
+    page_replay.appendFile(REPLAY_FILE, label='Replay File')
+    replay_speed = page_replay.appendFloat(REPLAY_SPEED, label='Speed')[0]
+    replay_speed.default = 1.0
+    replay_speed.val = 1.0
+    page_replay.appendFloat(REPLAY_SEEK, label='Seek (s)')
+    page_replay.appendToggle(LOOP_REPLAY, label='Loop')
+    page_replay.appendPulse(PLAY_REPLAY, label='Play')
+    page_replay.appendPulse(SEEK_REPLAY, label='Seek')
+    page_replay.appendPulse(STOP_REPLAY, label='Stop')
+
+def build_tuning_page(script_op):
+    page_tuning = script_op.appendCustomPage('Tuning')
+    page_tuning.appendStr(TUNE_BAUD_RATES, label='Baud Rates To Try')
+    page_tuning.appendToggle(APPLY_TUNING, label='Apply Recommended Settings')
+    benchmark_file = page_tuning.appendFile(BENCHMARK_FILE, label='Benchmark File')[0]
+    benchmark_file.default = DEFAULT_BENCHMARK_FILE
+    benchmark_file.val = DEFAULT_BENCHMARK_FILE
+    page_tuning.appendPulse(BENCHMARK_BUS, label='Benchmark Bus')
+    use_cached_topology = page_tuning.appendToggle(USE_CACHED_TOPOLOGY, label='Use Cached Topology')[0]
+    use_cached_topology.default = True
+    use_cached_topology.val = True
+    topology_file = page_tuning.appendFile(TOPOLOGY_FILE, label='Topology File')[0]
+    topology_file.default = DEFAULT_TOPOLOGY_FILE
+    topology_file.val = DEFAULT_TOPOLOGY_FILE
+
+def build_stats_page(script_op):
+    page_stats = script_op.appendCustomPage('Stats')
+    publish_bus_stats = page_stats.appendToggle(PUBLISH_BUS_STATS, label='Bus Stats Channels')[0]
+    publish_bus_stats.default = True
+    publish_bus_stats.val = True
+    page_stats.appendPulse(SHOW_BUS_STATS, label='Show Bus Stats')
+    page_stats.appendPulse(RESET_BUS_STATS, label='Reset Bus Stats')
+
 def fill_initial_eeprom_table():
     EEPROM_TABLE.clear()
     EEPROM_TABLE.appendCol()
     EEPROM_TABLE.appendRow([row_name for key, row_name in EEPROM_ROW_NAME_DICT.items()])
 
 def fill_initial_ram_table():
+    MOTOR_ROW_INDEX.clear()
     RAM_TABLE.clear()
     RAM_TABLE.appendCol()
     RAM_TABLE.appendRow([row_name for key, row_name in RAM_ROW_NAME_DICT.items()])
@@ -354,10 +1523,57 @@ def fill_debug_info(messages: List[str]):
         DEBUG_TABLE.appendRow([message])
 
 def update_connected_motors(motors_id):
+    index_motor_types()
+
     global MOTORS
     MOTORS.clear()
     for motor_id in motors_id:
-        MOTORS.append(Motor(motor_id, get_motor_type(motor_id)))
+        model_number, firmware = DETECTED_MOTORS.get(motor_id, [0, 0])
+        MOTORS.append(Motor(motor_id, get_motor_type(motor_id), model_number, firmware, get_motor_bus(motor_id)))
+
+    # cached transactions reference the previous Motor objects
+    clear_transaction_plans()
+    invalidate_goal_shadow()
+
+def refresh_motors_config():
+    '''
+    pick up Type and Port edits of GlobalMotorsConfig made after setup, a port that was not opened by
+    the last setup still needs one
+    '''
+    if not ensure_motor_index():
+        return
+
+    changed = {}
+    for index, motor in enumerate(MOTORS):
+        motor_type = MOTOR_TYPE_INDEX.get(motor.ID)
+        if motor_type is None:
+            print(f"MotorID {motor.ID} is no longer in GlobalMotorsConfig, keeping it until the next setup")
+            continue
+
+        bus = get_motor_bus(motor.ID)
+        if bus is None:
+            print(f"Port {MOTOR_PORT_INDEX[motor.ID][0]} of MotorID {motor.ID} is not open, press Setup to use it")
+            bus = motor.Bus
+
+        if motor_type != motor.Type or bus is not motor.Bus:
+            try:
+                changed[index] = Motor(motor.ID, motor_type, motor.ModelNumber, motor.Firmware, bus)
+            except MotorTypeNotSupported as e:
+                # a Type cell being typed in, keep the previous one meanwhile
+                print(f"MotorID {motor.ID}: {e}")
+
+    if not changed:
+        return
+
+    # the bus thread caches plans of the previous Motor objects, the next cook starts it again
+    stop_bus_thread()
+    with BUS_LOCK:
+        for index, motor in changed.items():
+            MOTORS[index] = motor
+        clear_transaction_plans()
+        invalidate_goal_shadow()
+        # Indirect Address registers of another type sit elsewhere
+        reset_indirect_mapping()
 
 def test_list_motors():
     messages = []
@@ -377,10 +1593,40 @@ def get_selected_motors() -> List[Motor]:
 
     return selected_motors
 
-def get_row_index_by_motor_id(motor_id: int):
+def get_par_value(name: str, default=None):
+    '''
+    evaluate a custom parameter of the controller, default is returned when the parameter is not built yet
+    '''
+    par = CONTROLLER_OP.par[name]
+    if par is None:
+        return default
+
+    return par.eval()
+
+def index_motor_rows():
+    MOTOR_ROW_INDEX.clear()
     for index in range(1, RAM_TABLE.numRows):
-        if motor_id == int(RAM_TABLE[index, 0]):
-            return index
+        MOTOR_ROW_INDEX[int(RAM_TABLE[index, 0])] = index
+
+def invalidate_motor_indexes():
+    '''
+    drop the id lookups, call it from a DAT Execute when GlobalMotorsConfig or the motor tables are edited by hand
+    '''
+    global MOTOR_INDEX_VERSION
+    MOTOR_ROW_INDEX.clear()
+    MOTOR_TYPE_INDEX.clear()
+    MOTOR_PORT_INDEX.clear()
+    MOTOR_INDEX_VERSION = None
+
+def get_row_index_by_motor_id(motor_id: int):
+    row = MOTOR_ROW_INDEX.get(motor_id)
+
+    # rows were added or removed outside broadcast_ping
+    if row is None or len(MOTOR_ROW_INDEX) != RAM_TABLE.numRows - 1:
+        index_motor_rows()
+        row = MOTOR_ROW_INDEX.get(motor_id)
+
+    return row
 
 def write_to_table(val, table, row: int, col: int):
     table[row, col] = str(val)
@@ -398,7 +1644,9 @@ def handler_read_torque():
     motors = get_selected_motors()
 
     for motor in motors:
-        torque, comm_result, error = PACKET_HANDLER.read1ByteTxRx(PORT_HANDLER, motor.ID, motor.ControlTable.Torque.Address)
+        start = time.perf_counter()
+        torque, comm_result, error = PACKET_HANDLER.read1ByteTxRx(motor.Bus.PortHandler, motor.ID, motor.ControlTable.Torque.Address)
+        BUS_STATS.record('txrx', start, comm_result, error)
         check_comm_result(comm_result, error)
         write_to_table(torque, RAM_TABLE, get_row_index_by_motor_id(motor.ID), RAM.TORQUE.value)
 
@@ -412,135 +1660,1794 @@ def handler_write_torque():
         except ValueError:
             print(f"MotorID {motor.ID} torque value is empty disabling motor torque instead")
 
-        comm_result, error = PACKET_HANDLER.write1ByteTxRx(PORT_HANDLER, motor.ID, motor.ControlTable.Torque.Address, bool(torque))
-
-        check_comm_result(comm_result, error)
+        queue_command(motor, 'Torque', int(bool(torque)))
         print(f"Writing Torque: {torque} to motor_ID: {motor.ID}")
 
-def handler_read_current_position():
-    motors = get_selected_motors()
-    groupBulkRead = GroupBulkRead(PORT_HANDLER, PACKET_HANDLER)
+def read_bus_values(motors: List[Motor], register: str, fast: bool = True) -> Dict[int, int]:
+    # send bulk read request to port, parameters are only added when the selection changes
+    plan = get_read_plan(motors, register)
+    plan.txrx(fast)
 
-    # Add parameter storage for present position of all motors
-    for motor in motors:
-        addparam_result = groupBulkRead.addParam(motor.ID, motor.ControlTable.PresentPosition.Address, motor.ControlTable.PresentPosition.DataSize)
+    return {motor.ID: plan.get_value(motor) for motor in motors}
 
-        if addparam_result != True:
-            raise CommError(f"[ID:{motor.ID}] groupBulkRead addParam PresentPosition failed")
+def read_bus_blocks(motors: List[Motor], span: str, fast: bool = True) -> Dict[int, tuple]:
+    plan = get_read_plan(motors, span)
+    plan.txrx(fast)
 
-    # send bulk read request to port
-    comm_result = groupBulkRead.txRxPacket()
-    if comm_result != COMM_SUCCESS:
-        raise CommError(f"{PACKET_HANDLER.getTxRxResult(comm_result)}")
+    return {motor.ID: motor.ControlTable.Layouts[span].decode(plan.get_block(motor)) for motor in motors}
+
+def read_bus_registers(motors: List[Motor], names: List[str]) -> Dict[int, tuple]:
+    '''
+    motors must share one bus, one block read per span planned by ControlTable.plan_registers.
+    values follow names with None for the registers a model does not have
+    '''
+    plans = {motor.ID: motor.ControlTable.plan_registers(names) for motor in motors}
+    read = {motor.ID: {} for motor in motors}
+    for index in range(max(len(plan) for plan in plans.values())):
+        span_motors = [motor for motor in motors if len(plans[motor.ID]) > index]
+        blocks = read_bus_blocks(span_motors, plans[span_motors[0].ID][index][0])
+        for motor in span_motors:
+            read[motor.ID].update(zip(plans[motor.ID][index][1], blocks[motor.ID]))
+
+    return {motor_id: tuple(values.get(name) for name in names) for motor_id, values in read.items()}
+
+def read_registers(motors: List[Motor], names: List[str]) -> Dict[int, tuple]:
+    '''
+    any set of registers in the fewest block reads per bus, see read_bus_registers
+    '''
+    return merge_results(run_on_buses([(read_bus_registers, (bus_motors, names))
+                                       for bus_motors, _ in group_by_bus(motors)]))
+
+def read_present_positions(motors: List[Motor]) -> Dict[int, int]:
+    '''
+    bus only (no TouchDesigner access) so it can run on the bus thread
+    '''
+    return merge_results(run_on_buses([(read_bus_values, (bus_motors, 'PresentPosition'))
+                                       for bus_motors, _ in group_by_bus(motors)]))
+
+def read_blocks(motors: List[Motor], span: str) -> Dict[int, tuple]:
+    '''
+    read a contiguous span with one transaction per bus and decode it with ControlTable.Layouts[span]
+    '''
+    return merge_results(run_on_buses([(read_bus_blocks, (bus_motors, span))
+                                       for bus_motors, _ in group_by_bus(motors)]))
+
+def read_present_states(motors: List[Motor]) -> Dict[int, tuple]:
+    '''
+    read Present PWM through Present Temperature of all motors in one transaction, values follow PRESENT_STATE_FIELDS
+    '''
+    return read_blocks(motors, 'PresentState')
+
+def write_goals(motors: List[Motor], register: str, goals, deadband: float = DEFAULT_GOAL_DEADBAND):
+    '''
+    goals is a sequence or numpy array ordered like motors, motors sharing the register address
+    get one GroupSyncWrite, mixed control tables fall back to GroupBulkWrite.
+    only goals further than deadband from the last sent goal go on the wire
+    '''
+    goals = np.rint(np.asarray(goals, dtype=np.float64))
+    motors_id = np.fromiter((motor.ID for motor in motors), dtype=np.intp, count=len(motors))
+    shadow = get_goal_shadow(register)
+
+    # NaN (never sent) compares False and is always written
+    changed = ~(np.abs(goals - shadow[motors_id]) <= deadband)
+    if not changed.any():
+        return
+
+    calls = []
+    for bus_motors, indexes in group_by_bus(motors):
+        if changed[indexes].any():
+            calls.append((write_bus_goals, (bus_motors, register, goals[indexes], changed[indexes])))
+    run_on_buses(calls)
+
+    shadow[motors_id[changed]] = goals[changed]
+
+def write_bus_goals(motors: List[Motor], register: str, goals: np.ndarray, changed: np.ndarray):
+    address = getattr(motors[0].ControlTable, register).Address
+    if all(getattr(motor.ControlTable, register).Address == address for motor in motors):
+        plan = get_sync_write_plan(motors, register)
+        plan.set_values(goals)
+        # Send goals in one packet per PacketEntries motors (the motors of a packet execute at the same time)
+        plan.tx(None if changed.all() else changed)
+    else:
+        changed_motors = [motor for motor, is_changed in zip(motors, changed) if is_changed]
+        plan = get_write_plan(changed_motors, register)
+        for motor, goal in zip(changed_motors, goals[changed]):
+            plan.set_value(motor, int(goal))
+        plan.tx()
+
+def write_register(motors: List[Motor], register: str, values):
+    '''
+    write values (ordered like motors) whatever was sent before, one sync or bulk write per bus
+    '''
+    values = np.rint(np.asarray(values, dtype=np.float64))
+    changed = np.ones(len(motors), dtype=bool)
+    run_on_buses([(write_bus_goals, (bus_motors, register, values[indexes], changed[indexes]))
+                  for bus_motors, indexes in group_by_bus(motors)])
+
+    record_written_values([motor.ID for motor in motors], register, values)
+
+def record_written_values(motors_id: List[int], register: str, values):
+    '''
+    keep the goal shadow in step with a write done outside write_goals
+    '''
+    if register in GOAL_SHADOW:
+        GOAL_SHADOW[register][motors_id] = values
+    else:
+        # torque or mode changes may move the goals on the motor
+        invalidate_goal_shadow(motors_id)
+
+def read_register(motors: List[Motor], register: str) -> dict:
+    '''
+    values of a register or blocks of a span (decoded with ControlTable.Layouts), one read per bus.
+    A tuple of register names goes through read_registers
+    '''
+    if isinstance(register, tuple):
+        return read_registers(motors, list(register))
+
+    calls = []
+    for bus_motors, _ in group_by_bus(motors):
+        read_bus = read_bus_blocks if register in bus_motors[0].ControlTable.Layouts else read_bus_values
+        calls.append((read_bus, (bus_motors, register)))
+
+    return merge_results(run_on_buses(calls))
+
+def publish_present_positions(present_positions: Dict[int, int]):
+    for motor_id, present_position in present_positions.items():
+        write_to_table(present_position, RAM_TABLE, get_row_index_by_motor_id(motor_id), RAM.PRESENT_POSITION.value)
 
-    # retrieve data and write it to table for each selected motor
+def publish_present_states(present_states: Dict[int, tuple], fields: list = PRESENT_STATE_FIELDS):
+    for motor_id, values in present_states.items():
+        row = get_row_index_by_motor_id(motor_id)
+        for (ram_row, _), value in zip(fields, values):
+            if value is not None and ram_row is not None:
+                write_to_table(value, RAM_TABLE, row, ram_row.value)
+
+def get_table_goals(motors: List[Motor], ram_row: RAM) -> List[int]:
+    goals = []
     for motor in motors:
-        getdata_result = groupBulkRead.isAvailable(motor.ID, motor.ControlTable.PresentPosition.Address, motor.ControlTable.PresentPosition.DataSize)
-        if getdata_result != True:
-            raise CommError(f"[ID:{motor.ID}] groupBulkRead getdata failed")
+        goal = 0
+        try:
+            goal = int(read_from_table(RAM_TABLE, get_row_index_by_motor_id(motor.ID), ram_row.value))
+        except ValueError:
+            print(f"MotorID {motor.ID} {RAM_ROW_NAME_DICT[ram_row].lower()} value is empty sending 0 instead")
+        goals.append(goal)
 
-        # Get present position value
-        present_position = groupBulkRead.getData(motor.ID, motor.ControlTable.PresentPosition.Address, motor.ControlTable.PresentPosition.DataSize)
-        write_to_table(present_position, RAM_TABLE, get_row_index_by_motor_id(motor.ID), RAM.PRESENT_POSITION.value)
+    return goals
 
-    # Clear bulkread parameter storage
-    groupBulkRead.clearParam()
+def get_input_goals(script_op, motors: List[Motor]) -> np.ndarray:
+    '''
+    latest sample of every channel of the first input CHOP, channel i is the goal of selected motor i
+    '''
+    if not script_op.inputs:
+        raise GoalInputError("Goal source is set to CHOP input but nothing is connected to the first input")
+
+    goals = script_op.inputs[0].numpyArray()[:, -1]
+    if len(goals) < len(motors):
+        raise GoalInputError(f"Input CHOP has {len(goals)} channels for {len(motors)} selected motors")
+
+    return goals[:len(motors)]
+
+def handler_read_current_position():
+    motors = get_selected_motors()
+    if not motors:
+        return
+
+    publish_present_positions(read_present_positions(motors))
+
+def handler_read_present_state():
+    motors = get_selected_motors()
+    if not motors:
+        return
+
+    publish_present_states(read_present_states(motors))
 
 def set_operating_mode(motor: Motor, operating_mode: OperatingMode):
-    comm_result, error = PACKET_HANDLER.write1ByteTxRx(PORT_HANDLER, motor.ID, motor.ControlTable.OperatingMode.Address, operating_mode.value)
+    start = time.perf_counter()
+    comm_result, error = PACKET_HANDLER.write1ByteTxRx(motor.Bus.PortHandler, motor.ID, motor.ControlTable.OperatingMode.Address, operating_mode.value)
+    BUS_STATS.record('txrx', start, comm_result, error)
+    invalidate_goal_shadow([motor.ID])
     check_comm_result(comm_result, error)
     print(f"Setting motor: {motor.ID} operating mode to {operating_mode}")
 
 def handler_write_goal_position():
     motors = get_selected_motors()
-    groupBulkWrite = GroupBulkWrite(PORT_HANDLER, PACKET_HANDLER)
+    if not motors:
+        return
+
+    queue_goals(motors, 'GoalPosition', get_table_goals(motors, RAM.GOAL_POSITION),
+                float(get_par_value(GOAL_DEADBAND, DEFAULT_GOAL_DEADBAND)))
+
+def handler_write_goal_velocity():
+    motors = get_selected_motors()
+    if not motors:
+        return
+
+    queue_goals(motors, 'GoalVelocity', get_table_goals(motors, RAM.GOAL_VELOCITY),
+                float(get_par_value(GOAL_DEADBAND, DEFAULT_GOAL_DEADBAND)))
+
+def publish_blocks(motors: List[Motor], span: str, blocks: Dict[int, tuple], table):
+    for motor in motors:
+        row = get_row_index_by_motor_id(motor.ID)
+        for table_row, value in zip(motor.ControlTable.Layouts[span].Rows, blocks[motor.ID]):
+            if value is not None and table_row is not None:
+                write_to_table(value, table, row, table_row.value)
+
+def handler_read_eeprom():
+    '''
+    read the whole EEPROM area of all selected motors in one block read
+    '''
+    motors = get_selected_motors()
+    if not motors:
+        return
+
+    publish_blocks(motors, 'EEPROMArea', read_blocks(motors, 'EEPROMArea'), EEPROM_TABLE)
+
+def handler_read_ram():
+    '''
+    read the whole RAM area of all selected motors in one block read
+    '''
+    motors = get_selected_motors()
+    if not motors:
+        return
+
+    publish_blocks(motors, 'RAMArea', read_blocks(motors, 'RAMArea'), RAM_TABLE)
+
+def handler_write_eeprom():
+    # write operating mode only for now
+    motors = get_selected_motors()
 
     for motor in motors:
-        goal_position = 0
+        operating_mode = 0
         try:
-            goal_position = int(read_from_table(RAM_TABLE, get_row_index_by_motor_id(motor.ID), RAM.GOAL_POSITION.value))
+            operating_mode = int(read_from_table(EEPROM_TABLE, get_row_index_by_motor_id(motor.ID), EEPROM.OPERATING_MODE.value))
         except ValueError:
-            print(f"MotorID {motor.ID} goal position value is empty sending 0 position instead")
+            print(f"MotorID {motor.ID} operating mode value is empty not writing any data to the motor")
+            continue
 
-        param_goal_position = [ DXL_LOBYTE( DXL_LOWORD( goal_position ) ),
-                                DXL_HIBYTE( DXL_LOWORD( goal_position ) ),
-                                DXL_LOBYTE( DXL_HIWORD( goal_position ) ),
-                                DXL_HIBYTE( DXL_HIWORD( goal_position ) )]
+        queue_command(motor, 'OperatingMode', operating_mode)
 
-        addparam_result = groupBulkWrite.addParam(
-                            motor.ID,
-                            motor.ControlTable.GoalPosition.Address,
-                            motor.ControlTable.GoalPosition.DataSize,
-                            param_goal_position)
+################################################################################################################################
+'''
+Command Queue
+The write pulses only queue their values, onCook sends everything queued since the last cook at its start. An id
+can only appear once in a GroupBulkWrite, so a motor written again on another register starts the next batch and
+the batches go out in order (torque off still lands before an operating mode change). Writing the same register
+of a motor twice within a batch only sends the latest value. A batch of one register on one address goes out as a
+GroupSyncWrite. Neither write gets a status packet, a rejected value (operating mode with torque on) only shows
+on the next read.
+'''
+# pulses that only queue, every other pulse flushes the queue first so it sees the queued writes
+QUEUED_PULSES = [WRITE_TORQUE, WRITE_GOAL_POSITION, WRITE_GOAL_VELOCITY, WRITE_EEPROP]
+
+class Command:
+    def __init__(self, motor: Motor, register: str, value: int) -> None:
+        self.Motor = motor
+        self.Register = register
+        self.Value = value
+
+# batches sent in order, each one motor id -> command
+PENDING_COMMANDS: List[Dict[int, Command]] = []
+# latest failed flushes, shown in the Debug DAT with the bus stats
+COMMAND_ERRORS: List[str] = []
+MAX_COMMAND_ERRORS = 20
+
+def queue_command(motor: Motor, register: str, value: int):
+    # a value that does not fit is refused by the pulse that queued it rather than by a later cook
+    check_register_values([motor], register, getattr(motor.ControlTable, register), [value])
+
+    batch = PENDING_COMMANDS[-1] if PENDING_COMMANDS else None
+    command = batch.get(motor.ID) if batch is not None else None
+    if command is not None and command.Register == register:
+        command.Value = value
+        return
+
+    if batch is None or command is not None:
+        batch = {}
+        PENDING_COMMANDS.append(batch)
+    batch[motor.ID] = Command(motor, register, value)
+
+def queue_goals(motors: List[Motor], register: str, goals, deadband: float = DEFAULT_GOAL_DEADBAND):
+    '''
+    queue the goals further than deadband from the last sent goal, like write_goals
+    '''
+    goals = np.rint(np.asarray(goals, dtype=np.float64))
+    # all or nothing, a bad goal must not leave the motors before it queued
+    for motor, goal in zip(motors, goals):
+        check_register_values([motor], register, getattr(motor.ControlTable, register), [goal])
 
-        if addparam_result != True:
-            raise CommError(f"[ID:{motor.ID}] groupBulkRead addParam GoalPosition failed")
+    shadow = get_goal_shadow(register)
+    for motor, goal in zip(motors, goals):
+        if not abs(goal - shadow[motor.ID]) <= deadband:
+            queue_command(motor, register, int(goal))
 
-    # Send goal velocity in bulk (all command will be executed at the same time)
-    comm_result = groupBulkWrite.txPacket()
+def tx_command_batch(commands: List[Command]):
+    '''
+    commands must share one bus
+    '''
+    register = commands[0].Register
+    address = getattr(commands[0].Motor.ControlTable, register).Address
+    if all(command.Register == register and getattr(command.Motor.ControlTable, register).Address == address for command in commands):
+        motors = [command.Motor for command in commands]
+        write_bus_goals(motors, register, np.array([command.Value for command in commands], dtype=np.float64),
+                        np.ones(len(commands), dtype=bool))
+        return
+
+    # nothing of the batch goes out when one value does not fit
+    for command in commands:
+        check_register_values([command.Motor], command.Register, getattr(command.Motor.ControlTable, command.Register), [command.Value])
+
+    # a fresh group per flush, pulses are too rare to cache the parameters
+    group = GroupBulkWrite(commands[0].Motor.Bus.PortHandler, PACKET_HANDLER)
+    length = 0
+    for command in commands:
+        item = getattr(command.Motor.ControlTable, command.Register)
+        if length + 5 + item.DataSize > TXPACKET_MAX_LEN // 2:
+            tx_bulk_write(group)
+            group = GroupBulkWrite(commands[0].Motor.Bus.PortHandler, PACKET_HANDLER)
+            length = 0
+
+        if group.addParam(command.Motor.ID, item.Address, item.DataSize, to_param_bytes(command.Value, item.DataSize)) != True:
+            raise CommError(f"[ID:{command.Motor.ID}] groupBulkWrite addParam {command.Register} failed")
+        length += 5 + item.DataSize
+
+    tx_bulk_write(group)
+
+def tx_bulk_write(group):
+    start = time.perf_counter()
+    comm_result = group.txPacket()
+    BUS_STATS.record('bulk_write', start, comm_result)
     if comm_result != COMM_SUCCESS:
         raise CommError(f"{PACKET_HANDLER.getTxRxResult(comm_result)}")
 
-    # Clear bulkwrite parameter storage
-    groupBulkWrite.clearParam()
+def report_command_error(message: str):
+    COMMAND_ERRORS.append(message)
+    del COMMAND_ERRORS[:-MAX_COMMAND_ERRORS]
+    print(message)
+    fill_debug_info(COMMAND_ERRORS)
 
-def handler_write_goal_velocity():
-    motors = get_selected_motors()
-    groupBulkWrite = GroupBulkWrite(PORT_HANDLER, PACKET_HANDLER)
+def flush_commands():
+    '''
+    send the queued batches, a failed batch drops the ones after it so nothing is applied out of order
+    '''
+    batches = PENDING_COMMANDS[:]
+    PENDING_COMMANDS.clear()
 
-    # Add parameter storage for present position of all motors
+    for position, batch in enumerate(batches):
+        commands = list(batch.values())
+        try:
+            run_on_buses([(tx_command_batch, ([commands[index] for index in indexes],))
+                          for _, indexes in group_by_bus([command.Motor for command in commands])])
+        except (CommError, GoalInputError) as e:
+            registers = sorted({command.Register for command in commands})
+            message = (f"writing {', '.join(registers)} to MotorID {[command.Motor.ID for command in commands]} failed: {e}, "
+                       f"{len(batches) - position - 1} queued batches after it dropped")
+            report_command_error(message)
+            raise CommError(message) from e
+
+        for command in commands:
+            record_written_values([command.Motor.ID], command.Register, command.Value)
+
+################################################################################################################################
+'''
+Indirect Mapping
+The registers polled every cycle are scattered over the control table. Setup points the Indirect Address
+registers at them byte by byte so they appear back to back in Indirect Data and the Indirect Registers read mode
+gets all of them with one sync read. Indirect Address is EEPROM and can only be written with torque off, it is
+programmed the first time the Indirect Registers read mode is used after a setup and motors already holding the
+mapping are left alone.
+'''
+DEFAULT_INDIRECT_REGISTERS = 'GoalPosition PresentPosition PresentLoad HardwareErrorStatus PresentTemperature'
+INDIRECT_SPAN = 'IndirectBlock'
+
+# (RAM row or None, register) of the mapped registers, in Indirect Data order
+INDIRECT_FIELDS: list = []
+INDIRECT_FIELDS_NAMES: List[str] = []
+# motors whose Indirect Address registers hold the mapping
+INDIRECT_MAPPED_MOTORS = set()
+# whether program_indirect_mapping ran since the last setup
+INDIRECT_MAPPING_PROGRAMMED = False
+
+def get_indirect_registers() -> List[str]:
+    return str(get_par_value(INDIRECT_REGISTERS, DEFAULT_INDIRECT_REGISTERS)).replace(',', ' ').split()
+
+def map_indirect_registers(control_table: ControlTable, registers: List[str]) -> bytes:
+    '''
+    add the IndirectBlock span and an Indirect<register> item per register to the control table,
+    returns the Indirect Address entries (2 bytes each) the motors must hold
+    '''
+    addresses = []
+    offset = control_table.IndirectData.Address
+    for name in registers:
+        item = getattr(control_table, name)
+        addresses.extend(range(item.Address, item.Address + item.DataSize))
+        control_table.Registers['Indirect' + name] = ControlData(offset, item.DataSize, item.DataAccess, signed=item.Signed)
+        setattr(control_table, 'Indirect' + name, control_table.Registers['Indirect' + name])
+        offset += item.DataSize
+
+    if len(addresses) > control_table.IndirectData.DataSize:
+        raise CommError(f"Indirect registers need {len(addresses)} bytes, {control_table.Type} has {control_table.IndirectData.DataSize}")
+
+    control_table.IndirectBlock = ControlData(control_table.IndirectData.Address, len(addresses), DataAccess.READ_AND_WRITE)
+    control_table.IndirectAddressMap = ControlData(control_table.IndirectAddress.Address, 2 * len(addresses), DataAccess.READ_AND_WRITE)
+    control_table.Layouts[INDIRECT_SPAN] = BlockLayout(control_table, control_table.IndirectBlock,
+                                                       [(row, 'Indirect' + name) for row, name in INDIRECT_FIELDS])
+
+    return struct.pack(f'<{len(addresses)}H', *addresses)
+
+def split_write_batches(motors: List[Motor], mappings: Dict[str, bytes]) -> List[List[Motor]]:
+    '''
+    a full mapping is 5 + 2 * registers bytes per motor in a bulk write, split the motors so every
+    instruction packet stays below the SDK limit (with room for the header and byte stuffing)
+    '''
+    batches = [[]]
+    length = 0
     for motor in motors:
-        goal_velocity = 0
+        entry_length = 5 + len(mappings[motor.Type])
+        if batches[-1] and length + entry_length > TXPACKET_MAX_LEN // 2:
+            batches.append([])
+            length = 0
+        batches[-1].append(motor)
+        length += entry_length
+
+    return [batch for batch in batches if batch]
+
+def program_bus_indirect(motors: List[Motor], mappings: Dict[str, bytes]) -> List[int]:
+    '''
+    motors must share one bus, returns the ids holding the mapping afterwards
+    '''
+    plan = ReadPlan(motors, 'IndirectAddressMap')
+    plan.txrx()
+    stale = [motor for motor in motors if plan.get_block(motor) != mappings[motor.Type]]
+    if not stale:
+        return [motor.ID for motor in motors]
+
+    torques = read_bus_values(stale, 'Torque')
+    writable = [motor for motor in stale if torques[motor.ID] == 0]
+    for motor in stale:
+        if torques[motor.ID] != 0:
+            print(f"MotorID {motor.ID} has torque on, its indirect mapping is not programmed")
+
+    for batch in split_write_batches(writable, mappings):
+        write_plan = WritePlan(batch, 'IndirectAddressMap')
+        for motor in batch:
+            write_plan.set_bytes(motor, mappings[motor.Type])
+        write_plan.tx()
+    if writable:
+        print(f"Indirect mapping programmed on {[motor.ID for motor in writable]}")
+
+    unwritable = {motor.ID for motor in stale} - {motor.ID for motor in writable}
+    return [motor.ID for motor in motors if motor.ID not in unwritable]
+
+def reset_indirect_mapping():
+    '''
+    take the registers from the Indirect Registers parameter, nothing is written until ensure_indirect_mapping
+    '''
+    global INDIRECT_MAPPING_PROGRAMMED
+    INDIRECT_MAPPING_PROGRAMMED = False
+    INDIRECT_MAPPED_MOTORS.clear()
+    registers = get_indirect_registers()
+    ram_rows = {name: row for row, name in RAM_FIELDS}
+    INDIRECT_FIELDS[:] = [(ram_rows.get(name), name) for name in registers]
+    INDIRECT_FIELDS_NAMES[:] = registers
+
+def program_indirect_mapping(motors: List[Motor]):
+    reset_indirect_mapping()
+    registers = INDIRECT_FIELDS_NAMES
+    if not registers:
+        return
+
+    mappings = {}
+    for motor_type in {motor.Type for motor in motors}:
+        control_table = get_control_table(motor_type)
         try:
-            goal_velocity = int(read_from_table(RAM_TABLE, get_row_index_by_motor_id(motor.ID), RAM.GOAL_VELOCITY.value))
-        except ValueError:
-            print(f"MotorID {motor.ID} goal velocity value is empty sending 0 velocity instead")
+            if not control_table.has('IndirectAddress'):
+                raise CommError(f"{motor_type} has no Indirect Address registers")
+            mappings[motor_type] = map_indirect_registers(control_table, registers)
+        except (AttributeError, CommError) as e:
+            print(f"Indirect mapping skipped for {motor_type}: {e}")
+
+    mapped_motors = [motor for motor in motors if motor.Type in mappings]
+    results = run_on_buses([(program_bus_indirect, (bus_motors, mappings)) for bus_motors, _ in group_by_bus(mapped_motors)])
+    for motors_id in results:
+        INDIRECT_MAPPED_MOTORS.update(motors_id)
+
+def ensure_indirect_mapping(motors: List[Motor]):
+    '''
+    program every connected motor on the first use after a setup, then check motors hold the mapping
+    '''
+    global INDIRECT_MAPPING_PROGRAMMED
+    if not INDIRECT_MAPPING_PROGRAMMED:
+        program_indirect_mapping(MOTORS)
+        INDIRECT_MAPPING_PROGRAMMED = True
+
+    check_indirect_mapping(motors)
+
+def read_indirect_registers(motors: List[Motor]) -> Dict[int, tuple]:
+    '''
+    read the mapped registers of all motors with one sync read per bus, values follow INDIRECT_FIELDS
+    '''
+    ensure_indirect_mapping(motors)
+    return read_blocks(motors, INDIRECT_SPAN)
+
+def check_indirect_mapping(motors: List[Motor]):
+    unmapped = [motor.ID for motor in motors if motor.ID not in INDIRECT_MAPPED_MOTORS]
+    if unmapped:
+        raise CommError(f"Motors {unmapped} have no indirect mapping, turn their torque off and run Setup Parameters")
+
+################################################################################################################################
+'''
+Fault Tolerance
+With Tolerate Motor Faults on, a cook read failing for some motors no longer aborts the cook. The motors that
+answered before the failed one are published from the group read, the failed one is marked stale with the time
+and error and the motors after it are read one at a time until the retry budget, counted from the start of the
+failed group read, runs out. Every retry waits for its status packet only until then, the motors left untried
+keep their last values. A motor failing MAX_CONSECUTIVE_FAILURES reads in a row is dropped
+from the group read so it cannot fail it every cycle, and is probed on its own every REPROBE_INTERVAL seconds
+until it answers again.
+'''
+DEFAULT_RETRY_BUDGET_MS = 5.0
+MAX_CONSECUTIVE_FAILURES = 5
+REPROBE_INTERVAL = 1.0
+
+class MotorHealth:
+    def __init__(self) -> None:
+        self.Failures = 0
+        self.TotalFailures = 0
+        self.Stale = False
+        self.StaleSince = 0.0
+        self.ErrorCode = COMM_SUCCESS
+        self.Error = ''
+        self.Dropped = False
+        self.NextProbe = 0.0
+
+    def succeeded(self):
+        self.Failures = 0
+        self.Stale = False
+        self.Dropped = False
+
+    def failed(self, now: float, error_code: int, error: str):
+        if not self.Stale:
+            self.StaleSince = now
+        self.Stale = True
+        self.ErrorCode = error_code
+        self.Error = error
+        self.Failures += 1
+        self.TotalFailures += 1
+        if self.Failures >= MAX_CONSECUTIVE_FAILURES:
+            self.Dropped = True
+            self.NextProbe = now + REPROBE_INTERVAL
+
+# motor id -> health, written by whichever thread reads the bus
+MOTOR_HEALTH: Dict[int, MotorHealth] = {}
+
+# published next to the read values while faults are tolerated, one sample per motor
+HEALTH_CHANNEL_NAMES = ['Stale', 'StaleAge', 'ErrorCode']
+
+def get_motor_health(motor_id: int) -> MotorHealth:
+    if motor_id not in MOTOR_HEALTH:
+        MOTOR_HEALTH[motor_id] = MotorHealth()
+
+    return MOTOR_HEALTH[motor_id]
+
+def get_motor_health_messages() -> List[str]:
+    now = time.perf_counter()
+    messages = []
+    for motor_id, health in sorted(MOTOR_HEALTH.items()):
+        if health.TotalFailures == 0:
+            continue
+        state = 'dropped' if health.Dropped else 'stale' if health.Stale else 'ok'
+        if health.Stale:
+            state += f" for {now - health.StaleSince:.2f}s"
+        messages.append(f"MotorID {motor_id}: {state}, {health.TotalFailures} failed reads, "
+                        f"last error {health.ErrorCode}: {health.Error}")
+
+    return messages
+
+def get_health_samples(motors: List[Motor], now: float) -> np.ndarray:
+    '''
+    Stale (0 or 1), StaleAge (seconds) and ErrorCode rows with a column per motor, zeros for a motor reading fine
+    '''
+    samples = np.zeros((len(HEALTH_CHANNEL_NAMES), len(motors)), dtype=np.float32)
+    for index, motor in enumerate(motors):
+        health = MOTOR_HEALTH.get(motor.ID)
+        if health is not None and health.Stale:
+            samples[:, index] = (1.0, now - health.StaleSince, health.ErrorCode)
+
+    return samples
+
+def publish_motor_health(motors: List[Motor]):
+    now = time.perf_counter()
+    for motor, (stale, stale_age, error_code) in zip(motors, get_health_samples(motors, now).T):
+        row = get_row_index_by_motor_id(motor.ID)
+        write_to_table(int(stale), RAM_TABLE, row, RAM.STALE.value)
+        write_to_table(round(float(stale_age), 3), RAM_TABLE, row, RAM.STALE_AGE.value)
+        write_to_table(int(error_code), RAM_TABLE, row, RAM.ERROR_CODE.value)
+
+def get_retry_budget() -> float:
+    '''
+    retry budget in seconds, None when faults are not tolerated
+    '''
+    if not get_par_value(TOLERATE_FAULTS, False):
+        return None
+
+    return max(float(get_par_value(RETRY_BUDGET, DEFAULT_RETRY_BUDGET_MS)), 0.0) / 1000.0
 
-        param_goal_velocity = [ DXL_LOBYTE( DXL_LOWORD( goal_velocity ) ),
-                                DXL_HIBYTE( DXL_LOWORD( goal_velocity ) ),
-                                DXL_LOBYTE( DXL_HIWORD( goal_velocity ) ),
-                                DXL_HIBYTE( DXL_HIWORD( goal_velocity ) )]
+# register -> motor id -> last value read, what a motor the retries had no time for keeps publishing
+TOLERANT_VALUES: Dict[str, dict] = {}
 
-        addparam_result = groupBulkWrite.addParam(
-                            motor.ID,
-                            motor.ControlTable.GoalVelocity.Address,
-                            motor.ControlTable.GoalVelocity.DataSize,
-                            param_goal_velocity)
+def decode_register(motor: Motor, register: str, data: bytes):
+    '''
+    raw bytes decoded like read_bus_values or read_bus_blocks
+    '''
+    if register in motor.ControlTable.Layouts:
+        return motor.ControlTable.Layouts[register].decode(data)
 
-        if addparam_result != True:
-            raise CommError(f"[ID:{motor.ID}] groupBulkRead addParam GoalVelocity failed")
+    return int.from_bytes(data, 'little', signed=getattr(motor.ControlTable, register).Signed)
 
-    # Send goal velocity in bulk (all command will be executed at the same time)
-    comm_result = groupBulkWrite.txPacket()
+def read_motor(motor: Motor, register: str, deadline: float = None):
+    '''
+    read one motor on its own, a deadline (time.perf_counter) shortens the SDK status packet timeout to end there
+    '''
+    item = getattr(motor.ControlTable, register)
+    port_handler = motor.Bus.PortHandler
+    start = time.perf_counter()
+    if deadline is None:
+        data, comm_result, error = PACKET_HANDLER.readTxRx(port_handler, motor.ID, item.Address, item.DataSize)
+    else:
+        data, error = [], 0
+        comm_result = PACKET_HANDLER.readTx(port_handler, motor.ID, item.Address, item.DataSize)
+        if comm_result == COMM_SUCCESS:
+            remaining_ms = (deadline - time.perf_counter()) * 1000.0
+            port_handler.setPacketTimeoutMillis(max(min(port_handler.packet_timeout, remaining_ms), 0.0))
+            data, comm_result, error = PACKET_HANDLER.readRx(port_handler, motor.ID, item.DataSize)
+    BUS_STATS.record('txrx', start, comm_result, error)
     if comm_result != COMM_SUCCESS:
-        raise CommError(f"{PACKET_HANDLER.getTxRxResult(comm_result)}")
+        return None, comm_result, PACKET_HANDLER.getTxRxResult(comm_result)
+    if error != 0:
+        return None, comm_result, PACKET_HANDLER.getRxPacketError(error)
 
-    # Clear bulkwrite parameter storage
-    groupBulkWrite.clearParam()
+    return decode_register(motor, register, bytes(data)), comm_result, ''
 
-def handler_read_eeprom():
-    # read operating mode only for now
+def read_bus_tolerant(motors: List[Motor], register: str, read_bus, retry_budget: float) -> dict:
+    '''
+    motors must share one bus, read_bus is read_bus_values or read_bus_blocks. Returns the motors that answered
+    and the last values of the ones there was no time to retry
+    '''
+    now = time.perf_counter()
+    hot = [motor for motor in motors if not get_motor_health(motor.ID).Dropped]
+    probes = [motor for motor in motors if get_motor_health(motor.ID).Dropped and now >= get_motor_health(motor.ID).NextProbe]
+
+    values = {}
+    # a failed group read counts against the budget, a successful one leaves it whole for the probes
+    deadline = now + retry_budget
+    if hot:
+        try:
+            # while a motor is failing skip the Fast Sync Read, it fails as a whole and would only add its timeout
+            values = read_bus(hot, register, not any(get_motor_health(motor.ID).Failures for motor in hot))
+            for motor in hot:
+                get_motor_health(motor.ID).succeeded()
+            hot = []
+            deadline = time.perf_counter() + retry_budget
+        except CommError as e:
+            # replies after the failed motor are still in the input buffer
+            motors[0].Bus.PortHandler.clearPort()
+
+            # the motors before the one that timed out answered, so the failed read already tells which motor to blame
+            plan = get_read_plan(hot, register)
+            answered = plan.get_answered()
+            for motor in hot[:len(answered)]:
+                get_motor_health(motor.ID).succeeded()
+                values[motor.ID] = decode_register(motor, register, answered[motor.ID])
+            if plan.Result != COMM_SUCCESS and len(values) < len(hot):
+                get_motor_health(hot[len(values)].ID).failed(time.perf_counter(), plan.Result, str(e))
+                hot = hot[len(values) + 1:]
+
+    # motors that answered last cycle go first so a timing out motor only costs the budget once
+    hot.sort(key=lambda motor: get_motor_health(motor.ID).Failures)
+    last_values = TOLERANT_VALUES.setdefault(register, {})
+    for motor in hot + probes:
+        health = get_motor_health(motor.ID)
+        if time.perf_counter() >= deadline:
+            # not tried, keeps its last value and health, a dropped motor is probed again next cycle
+            if motor.ID in last_values and not health.Dropped:
+                values[motor.ID] = last_values[motor.ID]
+            continue
+
+        value, comm_result, error = read_motor(motor, register, deadline)
+        if value is None:
+            health.failed(time.perf_counter(), comm_result, error)
+        else:
+            health.succeeded()
+            values[motor.ID] = value
+
+    last_values.update(values)
+    return values
+
+# register read and bus function for every cook read mode
+COOK_READS = {
+    COOK_READ_POSITION : ('PresentPosition', read_bus_values),
+    COOK_READ_STATE    : ('PresentState', read_bus_blocks),
+    COOK_READ_INDIRECT : (INDIRECT_SPAN, read_bus_blocks)
+}
+
+def read_cook_values(motors: List[Motor], read_mode: str, retry_budget: float = None) -> dict:
+    '''
+    what onCook publishes for read_mode, bus only so it can run on the bus thread. Without a retry budget any
+    failed motor raises CommError, with one the motors that answered are returned
+    '''
+    if not motors:
+        return {}
+
+    if read_mode == COOK_READ_INDIRECT:
+        ensure_indirect_mapping(motors)
+
+    register, read_bus = COOK_READS.get(read_mode, COOK_READS[COOK_READ_POSITION])
+    if retry_budget is None:
+        calls = [(read_bus, (bus_motors, register)) for bus_motors, _ in group_by_bus(motors)]
+    else:
+        calls = [(read_bus_tolerant, (bus_motors, register, read_bus, retry_budget)) for bus_motors, _ in group_by_bus(motors)]
+
+    return merge_results(run_on_buses(calls))
+
+################################################################################################################################
+'''
+Bus Thread
+Runs reads and goal writes at a fixed rate away from the TouchDesigner main thread. onCook only copies out the
+latest snapshot and hands over the goals, table access stays on the main thread.
+'''
+# serializes transactions on the port between the bus thread and operator callbacks
+BUS_LOCK = threading.RLock()
+DEFAULT_BUS_RATE = 100.0
+
+class BusSnapshot:
+    def __init__(self) -> None:
+        self.ReadMode = COOK_READ_POSITION
+        self.Motors: List[Motor] = []
+        self.Values = {}
+        self.Timestamp = 0.0
+        self.Cycle = 0
+        self.Error = None
+
+class BusThread(threading.Thread):
+    def __init__(self, rate: float) -> None:
+        super().__init__(name='DynamixelBus', daemon=True)
+        self.Rate = rate
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._motors: List[Motor] = []
+        self._read_mode = COOK_READ_POSITION
+        self._retry_budget = None
+        self._goals = {}
+        self._trajectory: 'Trajectory' = None
+        self._trajectory_start = 0.0
+
+        # double buffer, the bus thread fills the back snapshot and swaps it to the front
+        self._front = BusSnapshot()
+        self._back = BusSnapshot()
+
+    def set_motors(self, motors: List[Motor], read_mode: str, retry_budget: float = None):
+        '''
+        retry_budget in seconds turns on fault tolerant reads, see read_cook_values
+        '''
+        with self._lock:
+            self._motors = motors
+            self._read_mode = read_mode
+            self._retry_budget = retry_budget
+
+    def set_goals(self, motors: List[Motor], register: str, goals, deadband: float = DEFAULT_GOAL_DEADBAND):
+        '''
+        queue goals for the next cycle, newer goals for the same register replace unsent ones
+        '''
+        with self._lock:
+            self._goals[register] = (motors, goals, deadband)
+
+    def play_trajectory(self, trajectory: 'Trajectory'):
+        '''
+        stream the trajectory from now on, sampled every cycle after the queued goals
+        '''
+        with self._lock:
+            self._trajectory = trajectory
+            self._trajectory_start = time.perf_counter()
+
+    def stop_trajectory(self):
+        with self._lock:
+            self._trajectory = None
+
+    def is_playing(self, trajectory: 'Trajectory' = None) -> bool:
+        '''
+        whether anything plays, or trajectory when given
+        '''
+        with self._lock:
+            return self._trajectory is not None if trajectory is None else self._trajectory is trajectory
+
+    def copy_snapshot(self) -> BusSnapshot:
+        snapshot = BusSnapshot()
+        with self._lock:
+            snapshot.ReadMode = self._front.ReadMode
+            snapshot.Motors = self._front.Motors
+            snapshot.Values = dict(self._front.Values)
+            snapshot.Timestamp = self._front.Timestamp
+            snapshot.Cycle = self._front.Cycle
+            snapshot.Error = self._front.Error
+
+        return snapshot
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        next_cycle = time.perf_counter()
+        cycle = 0
+
+        while not self._stop_event.is_set():
+            with self._lock:
+                motors, read_mode, retry_budget, goals = self._motors, self._read_mode, self._retry_budget, self._goals
+                trajectory, trajectory_start = self._trajectory, self._trajectory_start
+                self._goals = {}
+
+            snapshot = self._back
+            snapshot.ReadMode = read_mode
+            snapshot.Motors = motors
+            snapshot.Error = None
+            try:
+                with BUS_LOCK:
+                    for register, (goal_motors, goal_values, deadband) in goals.items():
+                        write_goals(goal_motors, register, goal_values, deadband)
+
+                    if trajectory is not None:
+                        elapsed = time.perf_counter() - trajectory_start
+                        write_goals(trajectory.Motors, trajectory.Register, trajectory.sample(elapsed), trajectory.Deadband)
+                        if trajectory.is_finished(elapsed):
+                            with self._lock:
+                                if self._trajectory is trajectory:
+                                    self._trajectory = None
+
+                    snapshot.Values = read_cook_values(motors, read_mode, retry_budget)
+            except CommError as e:
+                snapshot.Values = {}
+                snapshot.Error = str(e)
+
+            cycle += 1
+            snapshot.Cycle = cycle
+            snapshot.Timestamp = time.perf_counter()
+            if snapshot.Error is None:
+                record_values(motors, read_mode, snapshot.Values, snapshot.Timestamp)
+
+            with self._lock:
+                self._front, self._back = snapshot, self._front
+
+            # fixed rate, an overrun cycle starts the next one immediately instead of catching up
+            next_cycle += 1.0 / max(self.Rate, 1.0)
+            delay = next_cycle - time.perf_counter()
+            if delay > 0:
+                self._stop_event.wait(delay)
+            else:
+                next_cycle = time.perf_counter()
+
+BUS_THREAD: BusThread = None
+
+def start_bus_thread(rate: float) -> BusThread:
+    global BUS_THREAD
+    if BUS_THREAD is None or not BUS_THREAD.is_alive():
+        BUS_THREAD = BusThread(rate)
+        BUS_THREAD.start()
+
+    BUS_THREAD.Rate = rate
+    return BUS_THREAD
+
+def stop_bus_thread():
+    global BUS_THREAD
+    if BUS_THREAD is not None:
+        BUS_THREAD.stop()
+        BUS_THREAD.join(timeout=1.0)
+        BUS_THREAD = None
+
+def get_cook_goals(script_op, motors: List[Motor], write_mode: str, goal_source: str):
+    '''
+    register and goals onCook should send for write_mode, None when nothing is written
+    '''
+    if write_mode not in COOK_WRITE_REGISTERS or not motors:
+        return None
+
+    register, ram_row = COOK_WRITE_REGISTERS[write_mode]
+    if goal_source == GOAL_SOURCE_INPUT:
+        return register, get_input_goals(script_op, motors)
+
+    return register, get_table_goals(motors, ram_row)
+
+def cook_with_bus_thread(script_op, read_mode: str, write_mode: str, goal_source: str):
+    bus_thread = start_bus_thread(float(get_par_value(BUS_RATE, DEFAULT_BUS_RATE)))
     motors = get_selected_motors()
+    bus_thread.set_motors(motors, read_mode, get_retry_budget())
 
-    for motor in motors:
-        operating_mode, comm_result, error = PACKET_HANDLER.read1ByteTxRx(PORT_HANDLER, motor.ID, motor.ControlTable.OperatingMode.Address)
-        check_comm_result(comm_result, error)
-        write_to_table(operating_mode, EEPROM_TABLE, get_row_index_by_motor_id(motor.ID), EEPROM.OPERATING_MODE.value)
+    cook_goals = get_cook_goals(script_op, motors, write_mode, goal_source)
+    if cook_goals is not None:
+        register, goals = cook_goals
+        # the bus thread packs the goals later, keep its own copy of the array
+        bus_thread.set_goals(motors, register, np.array(goals), float(get_par_value(GOAL_DEADBAND, DEFAULT_GOAL_DEADBAND)))
 
-def handler_write_eeprom():
-    # write operating mode only for now
+    snapshot = bus_thread.copy_snapshot()
+    if snapshot.Error is not None:
+        raise CommError(snapshot.Error)
+
+    publish_cook_values(script_op, snapshot.ReadMode, snapshot.Motors, snapshot.Values)
+
+def cook_on_main_thread(script_op, read_mode: str, write_mode: str, goal_source: str):
     motors = get_selected_motors()
+    cook_goals = get_cook_goals(script_op, motors, write_mode, goal_source)
+    deadband = float(get_par_value(GOAL_DEADBAND, DEFAULT_GOAL_DEADBAND))
+    retry_budget = get_retry_budget()
+
+    # the async bus ticks on an executor thread, keep its packets out of this cook's transactions
+    with BUS_LOCK:
+        if cook_goals is not None:
+            register, goals = cook_goals
+            write_goals(motors, register, goals, deadband)
+
+        values = read_cook_values(motors, read_mode, retry_budget)
+    record_values(motors, read_mode, values)
+    publish_cook_values(script_op, read_mode, motors, values)
 
+################################################################################################################################
+'''
+Async Bus
+Awaitable reads and writes for coroutines (TDAsyncIO or a script's own event loop). Everything awaited within one
+tick is merged per register, the values of every caller become one sync or bulk write per bus (the latest value
+wins when a motor is written twice) and the motors of every read one sync or bulk read per bus. Registers go on
+the wire in the order they were first requested in the tick, writes before reads. The tick runs in the loop's
+default executor under BUS_LOCK so it never interleaves with the bus thread or the pulse handlers.
+
+    positions = await ASYNC_BUS.read(motors, 'PresentPosition')
+    loads_and_temperatures = await ASYNC_BUS.read(motors, ('PresentLoad', 'PresentTemperature'))
+    await ASYNC_BUS.write(motors, 'Torque', [1] * len(motors))
+'''
+# seconds between the first request of a tick and its transactions, 0 runs them on the next loop iteration
+DEFAULT_ASYNC_TICK = 0.0
+
+class AsyncRequest:
+    '''
+    requests of one register merged for the current tick, every caller awaits the same future
+    '''
+    def __init__(self, loop) -> None:
+        self.Motors: Dict[int, Motor] = {}
+        self.Values: Dict[int, int] = {}
+        self.Future = loop.create_future()
+
+    def run(self, register: str, is_write: bool):
+        motors = list(self.Motors.values())
+        if is_write:
+            write_register(motors, register, [self.Values[motor.ID] for motor in motors])
+            return None
+
+        return read_register(motors, register)
+
+class AsyncMotorBus:
+    def __init__(self, tick: float = DEFAULT_ASYNC_TICK) -> None:
+        self.Tick = tick
+        self._writes: Dict[str, AsyncRequest] = {}
+        self._reads: Dict[str, AsyncRequest] = {}
+        self._flush_handle = None
+        # the loop only keeps weak references to tasks, a tick flush in flight must not be collected
+        self._flush_tasks = set()
+
+    async def read(self, motors: List[Motor], register: str) -> dict:
+        '''
+        motor id -> value (decoded tuple for a span or a tuple of register names) of motors, raises what the merged
+        read raised (CommError when the bus failed)
+        '''
+        request = self._get_request(self._reads, register)
+        for motor in motors:
+            request.Motors[motor.ID] = motor
+
+        values = await asyncio.shield(request.Future)
+        return {motor.ID: values[motor.ID] for motor in motors}
+
+    async def write(self, motors: List[Motor], register: str, values):
+        '''
+        values ordered like motors, done once the merged write is on the wire
+        '''
+        request = self._get_request(self._writes, register)
+        for motor, value in zip(motors, values):
+            request.Motors[motor.ID] = motor
+            request.Values[motor.ID] = value
+
+        await asyncio.shield(request.Future)
+
+    def _get_request(self, requests: Dict[str, AsyncRequest], register: str) -> AsyncRequest:
+        loop = asyncio.get_running_loop()
+        if register not in requests:
+            requests[register] = AsyncRequest(loop)
+
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.Tick, self._schedule_flush, loop)
+
+        return requests[register]
+
+    def _schedule_flush(self, loop):
+        task = loop.create_task(self.flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def flush(self):
+        '''
+        send everything requested so far, the tick timer calls it but it can be awaited to flush early
+        '''
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        requests = [(register, request, True) for register, request in self._writes.items()] + \
+                   [(register, request, False) for register, request in self._reads.items()]
+        self._writes, self._reads = {}, {}
+        if not requests:
+            return
+
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(None, run_async_tick, requests)
+        except asyncio.CancelledError:
+            for _, request, _ in requests:
+                request.Future.cancel()
+            raise
+        except Exception as e:
+            # every caller awaits one of these futures, none may be left pending
+            results = [(None, e)] * len(requests)
+
+        for (_, request, _), (result, error) in zip(requests, results):
+            if request.Future.done():
+                continue
+            if error is not None:
+                request.Future.set_exception(error)
+            else:
+                request.Future.set_result(result)
+
+def run_async_tick(requests: List[Tuple[str, AsyncRequest, bool]]) -> list:
+    '''
+    executor side of AsyncMotorBus.flush, a failed register does not stop the others
+    '''
+    results = []
+    with BUS_LOCK:
+        for register, request, is_write in requests:
+            try:
+                results.append((request.run(register, is_write), None))
+            except Exception as e:
+                results.append((None, e))
+
+    return results
+
+ASYNC_BUS = AsyncMotorBus()
+
+################################################################################################################################
+'''
+Trajectory
+Pre-authored goals streamed by the bus thread on its own clock, every bus cycle samples the trajectory at the
+time since play with linear interpolation and sends one sync write, whatever the TouchDesigner frame rate does.
+A .npy file holds one row per sample: the time in seconds, then the goal of every selected motor in order.
+A CHOP holds one channel per selected motor, timed by its sample rate or by a channel named timestamp.
+'''
+TRAJECTORY_TIME_CHANNEL = 'timestamp'
+
+# Menu entries for TRAJECTORY_SOURCE
+TRAJECTORY_SOURCE_FILE = 'file'
+TRAJECTORY_SOURCE_CHOP = 'chop'
+
+class TrajectoryError(Exception):
+    pass
+
+class Trajectory:
+    def __init__(self, times, goals, motors: List[Motor], register: str, loop: bool = False,
+                 deadband: float = DEFAULT_GOAL_DEADBAND) -> None:
+        self.Times = np.ascontiguousarray(times, dtype=np.float64)
+        self.Goals = np.ascontiguousarray(goals, dtype=np.float64)
+        self.Motors = motors
+        self.Register = register
+        self.Loop = loop
+        self.Deadband = deadband
+
+        if self.Goals.ndim != 2 or len(self.Times) != len(self.Goals) or len(self.Times) == 0:
+            raise TrajectoryError(f"Trajectory needs one time per goal sample, got {len(self.Times)} times for goals of shape {self.Goals.shape}")
+        if self.Goals.shape[1] < len(motors):
+            raise TrajectoryError(f"Trajectory has goals for {self.Goals.shape[1]} motors, {len(motors)} motors are selected")
+        if np.any(np.diff(self.Times) <= 0):
+            raise TrajectoryError("Trajectory timestamps must be strictly increasing")
+
+        # play from zero and drop the goals of motors that are not selected
+        self.Times = self.Times - self.Times[0]
+        self.Goals = self.Goals[:, :len(motors)]
+        self.Duration = self.Times[-1]
+
+    def is_finished(self, elapsed: float) -> bool:
+        return not self.Loop and elapsed >= self.Duration
+
+    def sample(self, elapsed: float) -> np.ndarray:
+        '''
+        goals of every motor at elapsed seconds since play, held at the last sample once it is over
+        '''
+        if self.Loop and self.Duration > 0:
+            elapsed = elapsed % self.Duration
+
+        index = int(np.searchsorted(self.Times, elapsed, side='right'))
+        if index >= len(self.Times):
+            return self.Goals[-1]
+        if index == 0:
+            return self.Goals[0]
+
+        start, end = self.Times[index - 1], self.Times[index]
+        weight = (elapsed - start) / (end - start)
+        return self.Goals[index - 1] + weight * (self.Goals[index] - self.Goals[index - 1])
+
+def load_trajectory_file(path: str) -> Tuple[np.ndarray, np.ndarray]:
+    try:
+        samples = np.load(path)
+    except (OSError, ValueError) as e:
+        raise TrajectoryError(f"Failed to load trajectory {path}: {e}")
+
+    if samples.ndim != 2 or samples.shape[1] < 2:
+        raise TrajectoryError(f"Trajectory {path} must have one row per sample with a time and at least one goal, got shape {samples.shape}")
+
+    return samples[:, 0], samples[:, 1:]
+
+def load_trajectory_chop(chop) -> Tuple[np.ndarray, np.ndarray]:
+    if chop is None:
+        raise TrajectoryError("Trajectory source is set to CHOP but no Trajectory CHOP is set")
+
+    samples = chop.numpyArray()
+    names = [channel.name for channel in chop.chans()]
+    if TRAJECTORY_TIME_CHANNEL in names:
+        time_index = names.index(TRAJECTORY_TIME_CHANNEL)
+        return samples[time_index], np.delete(samples, time_index, axis=0).T
+
+    return np.arange(samples.shape[1]) / chop.rate, samples.T
+
+def load_trajectory(motors: List[Motor]) -> Trajectory:
+    if get_par_value(TRAJECTORY_SOURCE, TRAJECTORY_SOURCE_FILE) == TRAJECTORY_SOURCE_CHOP:
+        times, goals = load_trajectory_chop(get_par_value(TRAJECTORY_CHOP))
+    else:
+        times, goals = load_trajectory_file(str(get_par_value(TRAJECTORY_FILE, '')))
+
+    register, _ = COOK_WRITE_REGISTERS[get_par_value(TRAJECTORY_REGISTER, COOK_WRITE_GOAL_POSITION)]
+    return Trajectory(times, goals, motors, register, bool(get_par_value(LOOP_TRAJECTORY, False)),
+                      float(get_par_value(GOAL_DEADBAND, DEFAULT_GOAL_DEADBAND)))
+
+def is_trajectory_playing() -> bool:
+    return BUS_THREAD is not None and BUS_THREAD.is_playing()
+
+def handler_play_trajectory():
+    motors = get_selected_motors()
+    if not motors:
+        return
+
+    trajectory = load_trajectory(motors)
+    start_bus_thread(float(get_par_value(BUS_RATE, DEFAULT_BUS_RATE))).play_trajectory(trajectory)
+    print(f"Playing {trajectory.Duration:.3f} s trajectory of {trajectory.Register} on {len(motors)} motors")
+
+def handler_stop_trajectory():
+    if BUS_THREAD is not None:
+        BUS_THREAD.stop_trajectory()
+
+################################################################################################################################
+'''
+Channel Output
+In the channels output mode onCook publishes what it read as Script CHOP channels, one channel per register and
+one sample per motor (the ID channel tells which motor), each filled with one numpy copy. The RAM table is then
+only a mirror refreshed at Table Mirror Rate, 0 turns it off.
+Every selected motor keeps its sample when faults are tolerated, a stale motor holds the last value it published
+(NaN before its first read) and the Stale, StaleAge and ErrorCode channels and RAM table columns flag it.
+'''
+DEFAULT_TABLE_MIRROR_RATE = 1.0
+
+# channel names of every cook read mode, in the order the values are decoded
+OUTPUT_CHANNEL_NAMES = {
+    COOK_READ_POSITION: ['PresentPosition'],
+    COOK_READ_STATE: [attr for _, attr in PRESENT_STATE_FIELDS]
+}
+
+LAST_TABLE_MIRROR = 0.0
+
+# (read mode, channel names) -> motor id -> last value published, what a stale motor keeps showing
+HELD_CHANNEL_VALUES: Dict[tuple, dict] = {}
+
+def get_read_mode_registers(read_mode: str) -> List[str]:
+    if read_mode == COOK_READ_INDIRECT:
+        return INDIRECT_FIELDS_NAMES
+
+    return OUTPUT_CHANNEL_NAMES.get(read_mode, OUTPUT_CHANNEL_NAMES[COOK_READ_POSITION])
+
+def publish_channels(script_op, read_mode: str, motors: List[Motor], values: dict):
+    '''
+    values is motor id -> value or tuple of values like the read functions return, motors missing from it are
+    published with their held values
+    '''
+    if not motors:
+        return
+
+    names = get_read_mode_registers(read_mode)
+    held = HELD_CHANNEL_VALUES.setdefault((read_mode, tuple(names)), {})
+    held.update(values)
+    if len(values) == len(motors):
+        samples = np.array([values[motor.ID] for motor in motors], dtype=np.float32).reshape(len(motors), len(names))
+    else:
+        samples = np.full((len(motors), len(names)), np.nan, dtype=np.float32)
+        for index, motor in enumerate(motors):
+            if motor.ID in held:
+                samples[index] = held[motor.ID]
+
+    # one row per register so every channel copies a contiguous array
+    samples = samples.T.copy()
+
+    script_op.numSamples = len(motors)
+    script_op.appendChan('ID').copyNumpyArray(np.fromiter((motor.ID for motor in motors), dtype=np.float32, count=len(motors)))
+    for name, channel_samples in zip(names, samples):
+        script_op.appendChan(name).copyNumpyArray(channel_samples)
+
+    if get_par_value(TOLERATE_FAULTS, False):
+        for name, channel_samples in zip(HEALTH_CHANNEL_NAMES, get_health_samples(motors, time.perf_counter())):
+            script_op.appendChan(name).copyNumpyArray(channel_samples)
+
+def publish_cook_values(script_op, read_mode: str, motors: List[Motor], values: dict):
+    global LAST_TABLE_MIRROR
+    if get_par_value(OUTPUT_MODE, OUTPUT_TABLE) == OUTPUT_CHANNELS:
+        publish_channels(script_op, read_mode, motors, values)
+
+        mirror_rate = float(get_par_value(TABLE_MIRROR_RATE, DEFAULT_TABLE_MIRROR_RATE))
+        now = time.perf_counter()
+        if mirror_rate <= 0 or now - LAST_TABLE_MIRROR < 1.0 / mirror_rate:
+            return
+        LAST_TABLE_MIRROR = now
+
+    if read_mode == COOK_READ_STATE:
+        publish_present_states(values)
+    elif read_mode == COOK_READ_INDIRECT:
+        publish_present_states(values, INDIRECT_FIELDS)
+    else:
+        publish_present_positions(values)
+
+    if get_par_value(TOLERATE_FAULTS, False):
+        publish_motor_health(motors)
+
+################################################################################################################################
+'''
+Recorder
+Appends every cook read (every bus thread cycle when it runs) to a ring file made with np.lib.format.open_memmap,
+np.load(path, mmap_mode='r') reads it back as a structured array with a row per sample: 'Timestamp' (seconds
+since the epoch, 0 in rows not written yet), 'Valid' (False for a motor that did not answer) and one column per
+register of the read mode, each holding a value per motor. A full file wraps around and keeps the latest Record
+Length samples, the <file>.json sidecar holds the motor ids, registers and the next row to write.
+A new file starts when the recording restarts or the motors or read mode change, only the newest Record Files
+files are kept. Appending only stores numbers into the mapped file, the sidecar is written on rotation.
+'''
+DEFAULT_RECORD_FOLDER = 'recordings'
+DEFAULT_RECORD_LENGTH = 360000
+DEFAULT_RECORD_FILES = 10
+RECORD_FILE_PREFIX = 'dynamixel_'
+
+# register data size and sign -> numpy type of its column
+RECORD_DTYPES = {(1, False): 'u1', (1, True): 'i1', (2, False): '<u2', (2, True): '<i2', (4, False): '<u4', (4, True): '<i4'}
+
+def get_record_dtype(motors: List[Motor], registers: List[str]) -> np.dtype:
+    fields = [('Timestamp', '<f8'), ('Valid', '?', (len(motors),))]
+    for name in registers:
+        items = [getattr(motor.ControlTable, name) for motor in motors if motor.ControlTable.has(name)]
+        data_size = max((item.DataSize for item in items), default=4)
+        signed = any(item.Signed for item in items)
+        fields.append((name, RECORD_DTYPES.get((data_size, signed), '<i4'), (len(motors),)))
+
+    return np.dtype(fields)
+
+class Recorder:
+    def __init__(self, folder: str, length: int, files: int) -> None:
+        self.Folder = folder
+        self.Length = max(length, 1)
+        self.Files = max(files, 1)
+        self.Path = None
+        self.Data = None
+        self.Head = 0
+        self.Count = 0
+        self.Motors: List[Motor] = []
+        self.ReadMode = None
+        self.Closed = False
+        self._lock = threading.Lock()
+        # perf_counter is monotonic, the offset turns it into wall clock time once per recorder
+        self._clock_offset = time.time() - time.perf_counter()
+        self._timestamps = None
+        self._valid = None
+        self._columns = []
+        self._indexes = []
+
+    def append(self, motors: List[Motor], read_mode: str, values: dict, timestamp: float = None):
+        '''
+        values is motor id -> value or tuple of values like the read functions return, timestamp a perf_counter time
+        '''
+        with self._lock:
+            # the bus thread may still hold a recorder that was stopped
+            if self.Closed:
+                return
+            if self.Data is None or read_mode != self.ReadMode or motors != self.Motors:
+                self._rotate(motors, read_mode)
+
+            row = self.Head
+            valid = self._valid
+            # only position reads give a plain value, the others a tuple even with one register
+            single = read_mode == COOK_READ_POSITION or read_mode not in COOK_READS
+            for index, motor_id in self._indexes:
+                value = values.get(motor_id)
+                if value is None:
+                    valid[row, index] = False
+                    continue
+
+                valid[row, index] = True
+                if single:
+                    self._columns[0][row, index] = value
+                else:
+                    for column, register_value in zip(self._columns, value):
+                        if register_value is not None:
+                            column[row, index] = register_value
+
+            self._timestamps[row] = (time.perf_counter() if timestamp is None else timestamp) + self._clock_offset
+            self.Head = row + 1 if row + 1 < self.Length else 0
+            self.Count += 1
+
+    def close(self):
+        with self._lock:
+            self.Closed = True
+            self._close_file()
+
+    def _rotate(self, motors: List[Motor], read_mode: str):
+        self._close_file()
+
+        registers = list(get_read_mode_registers(read_mode))
+        os.makedirs(self.Folder, exist_ok=True)
+        self.Path = os.path.join(self.Folder, f"{RECORD_FILE_PREFIX}{datetime.now():%Y%m%d_%H%M%S_%f}.npy")
+        self.Data = np.lib.format.open_memmap(self.Path, mode='w+', dtype=get_record_dtype(motors, registers), shape=(self.Length,))
+        self.Head = 0
+        self.Count = 0
+        self.Motors = list(motors)
+        self.ReadMode = read_mode
+        self._timestamps = self.Data['Timestamp']
+        self._valid = self.Data['Valid']
+        self._columns = [self.Data[name] for name in registers]
+        self._indexes = [(index, motor.ID) for index, motor in enumerate(motors)]
+        self._save_sidecar()
+        self._remove_old_files()
+        print(f"Recording {read_mode} of motors {[motor.ID for motor in motors]} to {self.Path}")
+
+    def _close_file(self):
+        if self.Data is None:
+            return
+
+        self.Data.flush()
+        self._save_sidecar()
+        self.Data = None
+        self._timestamps = self._valid = None
+        self._columns = []
+
+    def _save_sidecar(self):
+        sidecar = {
+            'saved': datetime.now().isoformat(timespec='seconds'),
+            'motors': [motor.ID for motor in self.Motors],
+            'read_mode': self.ReadMode,
+            'registers': list(self.Data.dtype.names[2:]),
+            'length': self.Length,
+            'head': self.Head,
+            'count': self.Count
+        }
+        try:
+            with open(self.Path + '.json', 'w') as file:
+                json.dump(sidecar, file, indent=2)
+        except OSError as error:
+            print(f"Recording sidecar not saved to {self.Path}.json: {error}")
+
+    def _remove_old_files(self):
+        paths = sorted(name for name in os.listdir(self.Folder) if name.startswith(RECORD_FILE_PREFIX) and name.endswith('.npy'))
+        for name in paths[:-self.Files]:
+            for path in (os.path.join(self.Folder, name), os.path.join(self.Folder, name + '.json')):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+RECORDER: Recorder = None
+
+def update_recorder():
+    '''
+    start or stop recording to follow the Record toggle, folder and length changes apply to the next recording
+    '''
+    global RECORDER
+    if get_par_value(RECORD, False):
+        if RECORDER is None:
+            RECORDER = Recorder(str(get_par_value(RECORD_FOLDER, DEFAULT_RECORD_FOLDER)) or DEFAULT_RECORD_FOLDER,
+                                int(get_par_value(RECORD_LENGTH, DEFAULT_RECORD_LENGTH)),
+                                int(get_par_value(RECORD_FILES, DEFAULT_RECORD_FILES)))
+    else:
+        stop_recorder()
+
+def stop_recorder():
+    global RECORDER
+    if RECORDER is not None:
+        RECORDER.close()
+        RECORDER = None
+
+def record_values(motors: List[Motor], read_mode: str, values: dict, timestamp: float = None):
+    recorder = RECORDER
+    if recorder is not None and motors:
+        recorder.append(motors, read_mode, values, timestamp)
+
+################################################################################################################################
+'''
+Replay
+Streams recorded present positions back as goal positions on the bus thread like a trajectory, at the recorded
+timing scaled by Speed, from Seek seconds into the recording and optionally looped. The file is opened with
+mmap_mode='r' and every bus cycle only binary searches the timestamps and reads one row, so hour long recordings
+never load into RAM. A Recorder file is matched to the selected motors by the ids in its sidecar, samples a motor
+did not answer in hold its previous goal. A plain .npy holds one row per sample: the time in seconds, then the
+position of every selected motor in order like a trajectory file.
+'''
+REPLAY_REGISTER = 'PresentPosition'
+
+def find_ring_start(timestamps) -> Tuple[int, int]:
+    '''
+    oldest row and number of samples of a ring file. Its timestamps increase up to the newest row and start over
+    at the oldest one, rows never written are 0, so the start is the first row older than row 0
+    '''
+    length = len(timestamps)
+    if length == 0 or timestamps[0] <= 0:
+        return 0, 0
+
+    first = timestamps[0]
+    low, high = 1, length
+    while low < high:
+        middle = (low + high) // 2
+        if timestamps[middle] >= first:
+            low = middle + 1
+        else:
+            high = middle
+
+    if low == length:
+        return 0, length
+    if timestamps[low] <= 0:
+        # never wrapped, the file is only written up to low
+        return 0, low
+
+    return low, length
+
+class Replay:
+    '''
+    plays through the bus thread like a Trajectory (Motors, Register, Deadband, sample, is_finished)
+    '''
+    def __init__(self, timestamps, positions, valid, start: int, count: int, columns: List[int], motors: List[Motor],
+                 hold: np.ndarray, speed: float = 1.0, offset: float = 0.0, loop: bool = False,
+                 deadband: float = DEFAULT_GOAL_DEADBAND) -> None:
+        if count == 0:
+            raise TrajectoryError("Replay has no samples")
+        if speed <= 0:
+            raise TrajectoryError(f"Replay speed must be above 0, got {speed}")
+
+        self.Timestamps = timestamps
+        self.Positions = positions
+        self.Valid = valid
+        self.Start = start
+        self.Count = count
+        self.Columns = np.asarray(columns, dtype=np.intp)
+        self.Motors = motors
+        self.Register = 'GoalPosition'
+        self.Speed = speed
+        self.Offset = offset
+        self.Loop = loop
+        self.Deadband = deadband
+        self.Hold = np.asarray(hold, dtype=np.float64)
+
+        # chronological order is Start..end of the file then 0..Start, both increasing
+        self._older = timestamps[start:start + count]
+        self._newer = timestamps[:max(start + count - len(timestamps), 0)]
+        self.First = float(self._older[0])
+        self.Duration = float((self._newer[-1] if len(self._newer) else self._older[-1]) - self.First)
+
+    def seek(self, offset: float) -> 'Replay':
+        '''
+        copy starting offset seconds into the recording, the file and held goals are shared
+        '''
+        replay = copy.copy(self)
+        replay.Offset = offset
+        return replay
+
+    def get_position(self, elapsed: float) -> float:
+        position = self.Offset + elapsed * self.Speed
+        if self.Loop and self.Duration > 0:
+            position = position % self.Duration
+
+        return position
+
+    def is_finished(self, elapsed: float) -> bool:
+        return not self.Loop and self.get_position(elapsed) >= self.Duration
+
+    def sample(self, elapsed: float) -> np.ndarray:
+        '''
+        goals of every motor from the last sample at or before elapsed seconds since play
+        '''
+        timestamp = self.First + self.get_position(elapsed)
+        if len(self._newer) and timestamp >= self._newer[0]:
+            index = len(self._older) + int(np.searchsorted(self._newer, timestamp, side='right')) - 1
+        else:
+            index = max(int(np.searchsorted(self._older, timestamp, side='right')) - 1, 0)
+
+        row = (self.Start + index) % len(self.Timestamps)
+        goals = self.Positions[row, self.Columns]
+        if self.Valid is None:
+            self.Hold[:] = goals
+        else:
+            valid = self.Valid[row, self.Columns]
+            self.Hold[valid] = goals[valid]
+
+        return self.Hold
+
+def load_replay(path: str, motors: List[Motor], speed: float = 1.0, offset: float = 0.0, loop: bool = False,
+                deadband: float = DEFAULT_GOAL_DEADBAND) -> Replay:
+    try:
+        data = np.load(path, mmap_mode='r')
+    except (OSError, ValueError) as e:
+        raise TrajectoryError(f"Failed to load replay {path}: {e}")
+
+    if data.dtype.names is not None:
+        if REPLAY_REGISTER not in data.dtype.names:
+            raise TrajectoryError(f"Recording {path} has no {REPLAY_REGISTER}, record with the position or state read mode")
+        try:
+            with open(path + '.json') as file:
+                recorded_motors = json.load(file)['motors']
+        except (OSError, ValueError, KeyError) as e:
+            raise TrajectoryError(f"Failed to load the motor ids of {path} from {path}.json: {e}")
+
+        timestamps, positions, valid = data['Timestamp'], data[REPLAY_REGISTER], data['Valid']
+        start, count = find_ring_start(timestamps)
+    else:
+        if data.ndim != 2 or data.shape[1] < 2:
+            raise TrajectoryError(f"Replay {path} must have one row per sample with a time and at least one position, got shape {data.shape}")
+
+        recorded_motors = [motor.ID for motor in motors][:data.shape[1] - 1]
+        timestamps, positions, valid = data[:, 0], data[:, 1:], None
+        start, count = 0, len(data)
+
+    replay_motors = [motor for motor in motors if motor.ID in recorded_motors]
+    if not replay_motors:
+        raise TrajectoryError(f"None of the selected motors are in {path}, it has motors {recorded_motors}")
+
+    # a motor holds its present position until its first recorded sample
+    present_positions = read_present_positions(replay_motors)
+    hold = [present_positions[motor.ID] for motor in replay_motors]
+    return Replay(timestamps, positions, valid, start, count, [recorded_motors.index(motor.ID) for motor in replay_motors],
+                  replay_motors, hold, speed, offset, loop, deadband)
+
+REPLAY: Replay = None
+
+def handler_play_replay():
+    global REPLAY
+    motors = get_selected_motors()
+    if not motors:
+        return
+
+    REPLAY = load_replay(str(get_par_value(REPLAY_FILE, '')), motors, float(get_par_value(REPLAY_SPEED, 1.0)),
+                         float(get_par_value(REPLAY_SEEK, 0.0)), bool(get_par_value(LOOP_REPLAY, False)),
+                         float(get_par_value(GOAL_DEADBAND, DEFAULT_GOAL_DEADBAND)))
+    start_bus_thread(float(get_par_value(BUS_RATE, DEFAULT_BUS_RATE))).play_trajectory(REPLAY)
+    print(f"Replaying {REPLAY.Duration:.3f} s of {len(REPLAY.Motors)} motors at {REPLAY.Speed}x from {REPLAY.Offset:.3f} s")
+
+def handler_seek_replay():
+    '''
+    jump the playing replay to Seek seconds, Speed and Loop stay as they were on play
+    '''
+    global REPLAY
+    if REPLAY is None or BUS_THREAD is None or not BUS_THREAD.is_playing(REPLAY):
+        return
+
+    REPLAY = REPLAY.seek(float(get_par_value(REPLAY_SEEK, 0.0)))
+    BUS_THREAD.play_trajectory(REPLAY)
+
+################################################################################################################################
+'''
+Bus Benchmark
+Measures ping and read round trips per port over motor counts, packet sizes, baud rates and Return Delay Time,
+recommends the fastest settings every motor answered with and optionally keeps them.
+Baud Rate and Return Delay Time live in EEPROM so every motor on the port must have torque off.
+'''
+# X/MX series Baud Rate register value -> bps
+BAUD_RATE_INDEX = {9600: 0, 57600: 1, 115200: 2, 1000000: 3, 2000000: 4, 3000000: 5, 4000000: 6, 4500000: 7}
+BENCHMARK_REGISTERS = ['PresentPosition', 'PresentState', 'RAMArea']
+# the cycle read the recommendation is ranked by
+BENCHMARK_RANK_REGISTER = 'PresentState'
+BENCHMARK_REPEATS = 20
+RETURN_DELAY_TIME_CANDIDATES = [0]
+DEFAULT_BENCHMARK_FILE = 'dynamixel_benchmark.json'
+
+def get_tune_baud_rates(bus: Bus) -> List[int]:
+    baud_rates = [bus.Baudrate]
+    for value in str(get_par_value(TUNE_BAUD_RATES, '')).replace(',', ' ').split():
+        if int(value) not in BAUD_RATE_INDEX:
+            raise CommError(f"Baudrate {value} is not supported, supported baudrates: {list(BAUD_RATE_INDEX)}")
+        if int(value) not in baud_rates:
+            baud_rates.append(int(value))
+
+    return baud_rates
+
+def set_comm_settings(bus: Bus, motors: List[Motor], baudrate: int, return_delay_time: int) -> bool:
+    '''
+    write Baud Rate and Return Delay Time of all motors in one bulk write, follow the port and
+    return whether every motor answers the verification ping
+    '''
+    plan = WritePlan(motors, 'CommSettings')
     for motor in motors:
-        operating_mode = 0
+        plan.set_value(motor, BAUD_RATE_INDEX[baudrate] | return_delay_time << 8)
+    plan.tx()
+
+    # the packet must leave at the old baudrate before the port is switched
+    time.sleep(0.05)
+    if not bus.PortHandler.setBaudRate(baudrate):
+        raise CommError(f"Failed to set baudrate to {baudrate} on {bus.PortName}")
+    bus.Baudrate = baudrate
+
+    try:
+        detected = bus.broadcast_ping()
+    except CommError:
+        return False
+
+    return all(motor.ID in detected for motor in motors)
+
+def time_transaction(transaction, repeats: int) -> dict:
+    latencies = []
+    errors = 0
+    for _ in range(repeats):
+        start = time.perf_counter()
         try:
-            operating_mode = int(read_from_table(EEPROM_TABLE, get_row_index_by_motor_id(motor.ID), EEPROM.OPERATING_MODE.value))
-        except ValueError:
-            print(f"MotorID {motor.ID} operating mode value is empty not writing any data to the motor")
+            transaction()
+        except CommError:
+            errors += 1
             continue
+        latencies.append((time.perf_counter() - start) * 1000.0)
 
-        comm_result, error = PACKET_HANDLER.write1ByteTxRx(PORT_HANDLER, motor.ID, motor.ControlTable.OperatingMode.Address, operating_mode)
-        check_comm_result(comm_result, error)
+    if not latencies:
+        return {'p50_ms': None, 'max_ms': None, 'errors': errors}
+
+    return {'p50_ms': round(float(np.percentile(latencies, 50)), 3), 'max_ms': round(max(latencies), 3), 'errors': errors}
+
+def ping_motor(motor: Motor):
+    start = time.perf_counter()
+    _, comm_result, error = PACKET_HANDLER.ping(motor.Bus.PortHandler, motor.ID)
+    BUS_STATS.record('ping', start, comm_result, error)
+    check_comm_result(comm_result, error)
+
+def benchmark_settings(bus: Bus, motors: List[Motor], return_delay_time: int) -> List[dict]:
+    '''
+    ping and read round trips at the current port settings, plans are built here so the cache is left alone
+    '''
+    results = []
+    setting = {'port': bus.PortName, 'baudrate': bus.Baudrate, 'return_delay_time': return_delay_time}
+
+    result = time_transaction(lambda: ping_motor(motors[0]), BENCHMARK_REPEATS)
+    results.append(dict(setting, transaction='ping', register='', data_size=0, motors=1, **result))
+
+    for motor_count in sorted({1, max(1, len(motors) // 2), len(motors)}):
+        for register in BENCHMARK_REGISTERS:
+            plan = ReadPlan(motors[:motor_count], register)
+            data_size = getattr(motors[0].ControlTable, register).DataSize
+            result = time_transaction(plan.txrx, BENCHMARK_REPEATS)
+            result['throughput_Bps'] = data_size * motor_count / result['p50_ms'] * 1000.0 if result['p50_ms'] else 0.0
+            results.append(dict(setting, transaction='read', register=register, data_size=data_size, motors=motor_count, **result))
+
+    return results
+
+def recommend_settings(results: List[dict]) -> dict:
+    '''
+    fastest error free full motor count read of BENCHMARK_RANK_REGISTER
+    '''
+    motor_count = max(result['motors'] for result in results)
+    ranked = {}
+    for result in results:
+        key = (result['baudrate'], result['return_delay_time'])
+        if result['errors'] or result['p50_ms'] is None:
+            ranked[key] = None
+        elif key not in ranked and result['register'] == BENCHMARK_RANK_REGISTER and result['motors'] == motor_count:
+            ranked[key] = result['p50_ms']
+
+    valid = [(p50_ms, key) for key, p50_ms in ranked.items() if p50_ms is not None]
+    if not valid:
+        return None
+
+    p50_ms, (baudrate, return_delay_time) = min(valid)
+    return {'baudrate': baudrate, 'return_delay_time': return_delay_time, 'p50_ms': p50_ms}
+
+def update_config_baudrate(bus: Bus, baudrate: int):
+    '''
+    keep GlobalCommConfig and GlobalMotorsConfig in line with the baudrate the motors now use, every row on the
+    bus gets it in its Baudrate cell (rows left empty would reopen a secondary port at the global baudrate)
+    '''
+    if get_port_name() == bus.PortName:
+        GLOBAL_COMM_CONFIG[2, 1] = baudrate
+
+    baudrate_col = get_motors_config_col(MOTORS_CONFIG_BAUDRATE_COL)
+    port_col = get_motors_config_col(MOTORS_CONFIG_PORT_COL)
+    if baudrate_col is None:
+        if get_port_name() == bus.PortName:
+            return
+        GLOBAL_MOTORS_CONFIG.appendCol([MOTORS_CONFIG_BAUDRATE_COL])
+        baudrate_col = GLOBAL_MOTORS_CONFIG.numCols - 1
+
+    for i in range(1, GLOBAL_MOTORS_CONFIG.numRows):
+        if (get_motors_config_cell(i, port_col) or get_port_name()) == bus.PortName:
+            GLOBAL_MOTORS_CONFIG[i, baudrate_col] = baudrate
+
+def benchmark_bus(bus: Bus, motors: List[Motor], apply: bool) -> dict:
+    '''
+    times the transactions of motors, the comm settings go to every motor on the port since they
+    all have to follow its baudrate
+    '''
+    port_motors = [motor for motor in MOTORS if motor.Bus is bus]
+    torques = read_bus_values(port_motors, 'Torque')
+    if any(torques.values()):
+        raise CommError(f"Disable torque of motors {[motor_id for motor_id, torque in torques.items() if torque]} on {bus.PortName} before benchmarking")
+
+    original_baudrate = bus.Baudrate
+    original_return_delay_time = read_bus_values(motors[:1], 'ReturnDelayTime')[motors[0].ID]
+    return_delay_times = [original_return_delay_time] + [rdt for rdt in RETURN_DELAY_TIME_CANDIDATES if rdt != original_return_delay_time]
+
+    results = []
+    failed = []
+    try:
+        for baudrate in get_tune_baud_rates(bus):
+            for return_delay_time in return_delay_times:
+                if not set_comm_settings(bus, port_motors, baudrate, return_delay_time):
+                    failed.append({'baudrate': baudrate, 'return_delay_time': return_delay_time})
+                    continue
+                results.extend(benchmark_settings(bus, motors, return_delay_time))
+    finally:
+        recommended = recommend_settings(results)
+        if apply and recommended is not None:
+            target = (recommended['baudrate'], recommended['return_delay_time'])
+        else:
+            target = (original_baudrate, original_return_delay_time)
+
+        applied = set_comm_settings(bus, port_motors, *target)
+        if not applied:
+            print(f"Motors on {bus.PortName} did not answer at baudrate {target[0]}, check them with a broadcast ping")
+
+    if applied and target[0] != original_baudrate:
+        update_config_baudrate(bus, target[0])
+
+    return {
+        'original': {'baudrate': original_baudrate, 'return_delay_time': original_return_delay_time},
+        'recommended': recommended,
+        'applied': apply and applied and recommended is not None,
+        'failed': failed,
+        'results': results
+    }
+
+def format_benchmark_report(report: dict) -> List[str]:
+    messages = []
+    for port_name, port_report in report['ports'].items():
+        messages.append(f"{port_name} original: {port_report['original']}")
+        for result in port_report['results']:
+            messages.append(f"{port_name} {result['baudrate']}bps rdt {result['return_delay_time']} {result['transaction']} "
+                            f"{result['register']} x{result['motors']}: p50 {result['p50_ms']} ms max {result['max_ms']} ms errors {result['errors']}")
+        for failed in port_report['failed']:
+            messages.append(f"{port_name} no answer at {failed}")
+        messages.append(f"{port_name} recommended: {port_report['recommended']} applied: {port_report['applied']}")
+
+    return messages
+
+def handler_benchmark_bus():
+    motors = get_selected_motors()
+    if not motors:
+        return
+
+    apply = bool(get_par_value(APPLY_TUNING, False))
+
+    report = {'timestamp': datetime.now().isoformat(), 'ports': {}}
+    for bus_motors, _ in group_by_bus(motors):
+        bus = bus_motors[0].Bus
+        report['ports'][bus.PortName] = benchmark_bus(bus, bus_motors, apply)
+
+    fill_debug_info(format_benchmark_report(report))
+
+    benchmark_file = str(get_par_value(BENCHMARK_FILE, DEFAULT_BENCHMARK_FILE)) or DEFAULT_BENCHMARK_FILE
+    with open(benchmark_file, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Bus benchmark written to {benchmark_file}")
 
 ################################################################################################################################
 # Operator callbacks
@@ -548,27 +3455,53 @@ def onSetupParameters(scriptOp):
     '''
     Setting up user interface and filling initial EEPROM and RAM from connected motors
     '''
-    # Check if the port is open. Close and re-open it
-    if PORT_HANDLER.is_open:
-        close_port()
-    open_port()
+    # the bus thread must not use the port while it is re-opened
+    stop_bus_thread()
+    stop_recorder()
+    PENDING_COMMANDS.clear()
+
+    for lazy in LAZY_OPERATORS:
+        lazy.reset()
+    reset_control_table_registry()
+    FAST_SYNC_READ_UNSUPPORTED.clear()
+    # build the packet handler here, its protocol comes from a DAT and the port workers must not create it
+    PACKET_HANDLER.get()
+
+    # Open the ports in GlobalCommConfig and GlobalMotorsConfig, unchanged ones stay open
+    open_ports()
 
     fill_initial_eeprom_table()
     fill_initial_ram_table()
 
-    # search for available motors
-    # motors_id = dummy_broadcast_ping()
-    motors_id = broadcast_ping()
+    # search for available motors, a sim:// port runs without hardware
+    topology_file = str(get_par_value(TOPOLOGY_FILE, DEFAULT_TOPOLOGY_FILE)) or DEFAULT_TOPOLOGY_FILE
+    topology = load_topology(topology_file) if get_par_value(USE_CACHED_TOPOLOGY, True) else {}
+    motors_id = discover_motors(topology)
+    save_topology(topology_file)
 
     # create motors based on GlobalMotorsConfig and check wether user the ID is present in the network
     update_connected_motors(motors_id)
 
+    # the mapping writes EEPROM, only program it now when the Indirect Registers read mode is already selected
+    reset_indirect_mapping()
+    if get_par_value(COOK_READ_MODE, COOK_READ_POSITION) == COOK_READ_INDIRECT:
+        try:
+            ensure_indirect_mapping(MOTORS)
+        except CommError as e:
+            print(f"Indirect mapping failed: {e}")
+
     build_motors_selector_page(scriptOp)
     build_eeprom_page(scriptOp)
     build_ram_page(scriptOp)
     build_torque_page(scriptOp)
     build_position_page(scriptOp)
     build_velocity_page(scriptOp)
+    build_cook_page(scriptOp)
+    build_trajectory_page(scriptOp)
+    build_record_page(scriptOp)
+    build_replay_page(scriptOp)
+    build_tuning_page(scriptOp)
+    build_stats_page(scriptOp)
 
     return
 
@@ -576,13 +3509,23 @@ def onPulse(par):
     '''
     called whenever custom pulse parameter is pushed
     '''
-    button_name = par.name
+    with BUS_LOCK:
+        dispatch_pulse(par.name)
+
+    return
+
+def dispatch_pulse(button_name: str):
+    if button_name not in QUEUED_PULSES:
+        flush_commands()
+
     if button_name == READ_TORQUE:
         handler_read_torque()
     elif button_name == WRITE_TORQUE:
         handler_write_torque()
     elif button_name == READ_CURRENT_POSITION:
         handler_read_current_position()
+    elif button_name == READ_PRESENT_STATE:
+        handler_read_present_state()
     elif button_name == WRITE_GOAL_POSITION:
         handler_write_goal_position()
     elif button_name == WRITE_GOAL_VELOCITY:
@@ -592,14 +3535,50 @@ def onPulse(par):
     elif button_name == WRITE_EEPROP:
         handler_write_eeprom()
     elif button_name == READ_RAM:
-        raise NotImplementedError
+        handler_read_ram()
     elif button_name == WRITE_RAM:
         raise NotImplementedError
-
-    return
+    elif button_name == BENCHMARK_BUS:
+        handler_benchmark_bus()
+    elif button_name == SHOW_BUS_STATS:
+        fill_debug_info(BUS_STATS.get_messages() + get_motor_health_messages() + COMMAND_ERRORS)
+    elif button_name == RESET_BUS_STATS:
+        BUS_STATS.reset()
+        COMMAND_ERRORS.clear()
+    elif button_name == PLAY_TRAJECTORY:
+        handler_play_trajectory()
+    elif button_name == STOP_TRAJECTORY:
+        handler_stop_trajectory()
+    elif button_name == PLAY_REPLAY:
+        handler_play_replay()
+    elif button_name == SEEK_REPLAY:
+        handler_seek_replay()
+    elif button_name == STOP_REPLAY:
+        handler_stop_trajectory()
 
 def onCook(scriptOp):
     scriptOp.clear()
+    scriptOp.numSamples = 1
     # print(datetime.now())
-    handler_read_current_position()
+    read_mode = get_par_value(COOK_READ_MODE, COOK_READ_POSITION)
+    write_mode = get_par_value(COOK_WRITE_MODE, COOK_WRITE_NONE)
+    goal_source = get_par_value(GOAL_SOURCE, GOAL_SOURCE_TABLE)
+
+    update_recorder()
+    refresh_motors_config()
+    try:
+        if PENDING_COMMANDS:
+            with BUS_LOCK:
+                flush_commands()
+
+        # a playing trajectory needs the bus thread whatever Run Bus On Thread says
+        if get_par_value(BUS_THREAD_ENABLE, False) or is_trajectory_playing():
+            cook_with_bus_thread(scriptOp, read_mode, write_mode, goal_source)
+        else:
+            stop_bus_thread()
+            cook_on_main_thread(scriptOp, read_mode, write_mode, goal_source)
+    finally:
+        # failed cooks are the ones worth watching
+        if get_par_value(PUBLISH_BUS_STATS, True):
+            publish_bus_stats(scriptOp)
     return
@@ -0,0 +1,487 @@
+'''
+Simulated Dynamixel bus for running the TouchDesigner scripts without hardware.
+
+SimulatedPortHandler is a drop-in replacement for dynamixel_sdk.PortHandler. The SDK packet handlers
+write instruction packets to it and read status packets back, the same way they do with a serial port.
+Every virtual motor keeps its own X-series control table, and replies are released with the timing of
+a real half-duplex bus (10 bits per byte at the port baudrate plus each motor's Return Delay Time).
+
+Put one of these port names in GlobalCommConfig (or the Port column of GlobalMotorsConfig):
+    sim://4         4 X-series motors with ID 1 to 4 (sim://253 uses every ID from 0 to 252)
+    sim://1,2,7     X-series motors with the listed IDs
+
+The motors start at 57600 bps like factory new ones. SimulatedPortHandler.Motors keeps them by ID so a
+script can preset registers or make a motor stop answering (SimulatedMotor.Unresponsive).
+'''
+import time
+import struct
+from typing import Dict, List
+
+################################################################################################################################
+# Protocol 2.0
+BROADCAST_ID = 0xFE
+
+INST_PING = 0x01
+INST_READ = 0x02
+INST_WRITE = 0x03
+INST_REG_WRITE = 0x04
+INST_ACTION = 0x05
+INST_REBOOT = 0x08
+INST_STATUS = 0x55
+INST_SYNC_READ = 0x82
+INST_SYNC_WRITE = 0x83
+INST_FAST_SYNC_READ = 0x8A
+INST_BULK_READ = 0x92
+INST_BULK_WRITE = 0x93
+
+ERRNUM_INSTRUCTION = 2
+ERRNUM_CRC = 3
+ERRNUM_DATA_RANGE = 4
+ERRNUM_ACCESS = 7
+
+SIM_PORT_PREFIX = 'sim://'
+
+# bytes the adapter can queue before a write blocks (USB serial adapter FIFO)
+TX_BUFFER_SIZE = 512
+MAX_ID = 252
+
+
+def _make_crc_table() -> List[int]:
+    table = []
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x8005) if crc & 0x8000 else (crc << 1)
+        table.append(crc & 0xFFFF)
+    return table
+
+CRC_TABLE = _make_crc_table()
+
+
+def update_crc(crc: int, data) -> int:
+    for byte in data:
+        crc = ((crc << 8) ^ CRC_TABLE[((crc >> 8) ^ byte) & 0xFF]) & 0xFFFF
+    return crc
+
+
+def add_stuffing(payload: bytes) -> bytes:
+    '''
+    insert 0xFD after every FF FF FD sequence found in instruction/parameter bytes
+    '''
+    out = bytearray()
+    for byte in payload:
+        out.append(byte)
+        if byte == 0xFD and len(out) >= 3 and out[-2] == 0xFF and out[-3] == 0xFF:
+            out.append(0xFD)
+    return bytes(out)
+
+
+def remove_stuffing(payload: bytes) -> bytes:
+    out = bytearray()
+    i = 0
+    while i < len(payload):
+        out.append(payload[i])
+        if payload[i] == 0xFD and len(out) >= 3 and out[-2] == 0xFF and out[-3] == 0xFF \
+                and i + 1 < len(payload) and payload[i + 1] == 0xFD:
+            i += 1
+        i += 1
+    return bytes(out)
+
+
+def make_packet(dxl_id: int, instruction: int, params: bytes, stuffing: bool = True) -> bytes:
+    body = bytes([instruction]) + bytes(params)
+    if stuffing:
+        body = add_stuffing(body)
+    length = len(body) + 2
+    packet = bytes([0xFF, 0xFF, 0xFD, 0x00, dxl_id, length & 0xFF, (length >> 8) & 0xFF]) + body
+    crc = update_crc(0, packet)
+    return packet + bytes([crc & 0xFF, (crc >> 8) & 0xFF])
+
+
+def make_status_packet(dxl_id: int, error: int, data: bytes = b'') -> bytes:
+    return make_packet(dxl_id, INST_STATUS, bytes([error]) + bytes(data))
+
+
+################################################################################################################################
+# Virtual motor
+X_SERIES_MODEL_NUMBER = 1020    # XM430-W350
+X_SERIES_FIRMWARE = 46
+CONTROL_TABLE_SIZE = 662
+EEPROM_END = 64
+
+# Baud Rate (EEPROM 8) value to bps
+BAUD_RATES = {0: 9600, 1: 57600, 2: 115200, 3: 1000000, 4: 2000000, 5: 3000000, 6: 4000000, 7: 4500000}
+
+INDIRECT_ADDRESS_BLOCKS = [(168, 224, 28), (578, 634, 28)]  # (first indirect address, first indirect data, count)
+
+
+class SimulatedMotor:
+    def __init__(self, id: int, model_number: int = X_SERIES_MODEL_NUMBER, firmware: int = X_SERIES_FIRMWARE,
+                 baud_rate: int = 1, return_delay_time: int = 250) -> None:
+        self.ID = id
+        self.ModelNumber = model_number
+        self.Firmware = firmware
+        self.Unresponsive = False
+        self.ControlTable = bytearray(CONTROL_TABLE_SIZE)
+        self._position = 2048.0
+
+        self._set(0, 2, model_number)
+        self._set(6, 1, firmware)
+        self._set(7, 1, id)
+        self._set(8, 1, baud_rate)
+        self._set(9, 1, return_delay_time)
+        self._set(11, 1, 3)          # Operating Mode: position control
+        self._set(13, 1, 2)          # Protocol Type
+        self._set(31, 1, 80)         # Temperature Limit
+        self._set(32, 2, 160)        # Max Voltage Limit
+        self._set(34, 2, 95)         # Min Voltage Limit
+        self._set(36, 2, 885)        # PWM Limit
+        self._set(44, 4, 200)        # Velocity Limit
+        self._set(48, 4, 4095)       # Max Position Limit
+        self._set(52, 4, 0)          # Min Position Limit
+        self._set(63, 1, 52)         # Shutdown
+        self._set(68, 1, 2)          # Status Return Level
+        self._set(84, 2, 800)        # Position P Gain
+        self._set(116, 4, 2048)      # Goal Position
+        self._set(144, 2, 120)       # Present Input Voltage
+        self._set(146, 1, 30)        # Present Temperature
+        self._update_present_state(0.0)
+
+    def _set(self, address: int, size: int, value: int) -> None:
+        self.ControlTable[address:address + size] = (value & ((1 << (8 * size)) - 1)).to_bytes(size, 'little')
+
+    def _get(self, address: int, size: int, signed: bool = False) -> int:
+        return int.from_bytes(self.ControlTable[address:address + size], 'little', signed=signed)
+
+    @property
+    def BaudRate(self) -> int:
+        return BAUD_RATES.get(self.ControlTable[8], 57600)
+
+    @property
+    def ReturnDelay(self) -> float:
+        '''
+        Return Delay Time in seconds (EEPROM 9, 2 usec per unit)
+        '''
+        return self.ControlTable[9] * 2e-6
+
+    def _resolve(self, address: int) -> int:
+        '''
+        translate an Indirect Data address to the address it is mapped to
+        '''
+        for first_address, first_data, count in INDIRECT_ADDRESS_BLOCKS:
+            if first_data <= address < first_data + count:
+                slot = address - first_data
+                return self._get(first_address + 2 * slot, 2)
+        return address
+
+    def read(self, address: int, length: int):
+        if address + length > CONTROL_TABLE_SIZE:
+            return ERRNUM_DATA_RANGE, b''
+        return 0, bytes(self.ControlTable[self._resolve(a)] for a in range(address, address + length))
+
+    def write(self, address: int, data: bytes) -> int:
+        if address + len(data) > CONTROL_TABLE_SIZE:
+            return ERRNUM_DATA_RANGE
+
+        torque_enabled = self.ControlTable[64] == 1
+        for offset, byte in enumerate(data):
+            target = self._resolve(address + offset)
+            is_locked = target < EEPROM_END or any(first <= target < first + 2 * count
+                                                   for first, _, count in INDIRECT_ADDRESS_BLOCKS)
+            if torque_enabled and is_locked:
+                return ERRNUM_ACCESS
+
+        for offset, byte in enumerate(data):
+            self.ControlTable[self._resolve(address + offset)] = byte
+        return 0
+
+    def step(self, dt: float) -> None:
+        '''
+        move Present Position toward Goal Position while torque is enabled
+        '''
+        self._update_present_state(dt)
+
+    def _update_present_state(self, dt: float) -> None:
+        velocity = 0.0
+        if self.ControlTable[64] == 1 and dt > 0:
+            goal = self._get(116, 4, signed=True)
+            # 0.229 rpm per unit, 4096 pulses per revolution
+            max_step = max(self._get(44, 4), 1) * 0.229 / 60.0 * 4096 * dt
+            delta = max(-max_step, min(max_step, goal - self._position))
+            self._position += delta
+            velocity = delta / dt / (0.229 / 60.0 * 4096)
+
+        self._set(122, 1, int(abs(velocity) > 0.5))                          # Moving
+        self._set(124, 2, int(velocity * 2))                                 # Present PWM
+        self._set(126, 2, int(velocity))                                     # Present Load
+        self._set(128, 4, int(round(velocity)))                              # Present Velocity
+        self._set(132, 4, int(round(self._position)))                        # Present Position
+        self._set(136, 4, int(round(velocity)))                              # Velocity Trajectory
+        self._set(140, 4, self._get(116, 4))                                 # Position Trajectory
+        self._set(120, 2, int(time.perf_counter() * 1000) & 0x7FFF)          # Realtime Tick
+
+
+################################################################################################################################
+# Port handler
+class SimulatedPortHandler(object):
+    '''
+    PortHandler look-alike backed by virtual motors instead of a serial port
+    '''
+    def __init__(self, port_name: str, motors: List[SimulatedMotor] = None) -> None:
+        self.is_open = False
+        self.baudrate = 57600
+        self.packet_start_time = 0.0
+        self.packet_timeout = 0.0
+        self.tx_time_per_byte = 0.0
+
+        self.is_using = False
+        self.port_name = port_name
+
+        if motors is None:
+            motors = [SimulatedMotor(motor_id) for motor_id in parse_sim_port_name(port_name)]
+        self.Motors: Dict[int, SimulatedMotor] = {motor.ID: motor for motor in motors}
+
+        # wire accounting, seconds the bus spent transferring bytes or waiting for return delays and
+        # seconds a caller had to wait for its status packets (write only packets do not block the caller)
+        self.WireTime = 0.0
+        self.WaitTime = 0.0
+        self.BytesWritten = 0
+        self.BytesRead = 0
+        self.Packets = 0
+
+        self._pending = []          # (ready time, status packet bytes)
+        self._rx_buffer = bytearray()
+        self._bus_free_at = 0.0
+        self._last_step = time.perf_counter()
+
+    def openPort(self):
+        return self.setBaudRate(self.baudrate)
+
+    def closePort(self):
+        self.is_open = False
+
+    def clearPort(self):
+        self._pending.clear()
+        self._rx_buffer.clear()
+
+    def setPortName(self, port_name):
+        self.port_name = port_name
+
+    def getPortName(self):
+        return self.port_name
+
+    def setBaudRate(self, baudrate):
+        if baudrate not in BAUD_RATES.values():
+            return False
+
+        self.baudrate = baudrate
+        self.tx_time_per_byte = (1000.0 / self.baudrate) * 10.0
+        self.is_open = True
+        return True
+
+    def getBaudRate(self):
+        return self.baudrate
+
+    def getBytesAvailable(self):
+        self._collect()
+        return len(self._rx_buffer)
+
+    def readPort(self, length):
+        self._collect()
+        if not self._rx_buffer:
+            # a serial read is a syscall that releases the GIL, let other port threads run
+            time.sleep(0)
+        data = bytes(self._rx_buffer[:length])
+        del self._rx_buffer[:length]
+        self.BytesRead += len(data)
+        return data
+
+    def writePort(self, packet):
+        packet = bytes(packet)
+        byte_time = 10.0 / self.baudrate
+
+        # write only packets queue up on the bus, block like a full adapter FIFO once the backlog is too long
+        now = time.perf_counter()
+        backlog = self._bus_free_at - now - TX_BUFFER_SIZE * byte_time
+        if backlog > 0:
+            time.sleep(backlog)
+            self.WaitTime += backlog
+            now = time.perf_counter()
+        self._step_motors(now)
+
+        start = max(now, self._bus_free_at)
+        cursor = start + len(packet) * byte_time
+
+        self.BytesWritten += len(packet)
+        self.Packets += 1
+
+        for motor, reply in self._handle_instruction(packet):
+            if motor.BaudRate != self.baudrate:
+                continue
+            cursor += motor.ReturnDelay
+            cursor += len(reply) * byte_time
+            self._pending.append((cursor, reply))
+
+        self.WireTime += cursor - start
+        if self._pending:
+            self.WaitTime += cursor - now
+        self._bus_free_at = cursor
+        return len(packet)
+
+    def setPacketTimeout(self, packet_length):
+        self.packet_start_time = self.getCurrentTime()
+        self.packet_timeout = (self.tx_time_per_byte * packet_length) + (16 * 2.0) + 2.0
+
+    def setPacketTimeoutMillis(self, msec):
+        self.packet_start_time = self.getCurrentTime()
+        self.packet_timeout = msec
+
+    def isPacketTimeout(self):
+        if self.getTimeSinceStart() > self.packet_timeout:
+            self.packet_timeout = 0
+            return True
+
+        return False
+
+    def getCurrentTime(self):
+        return time.perf_counter() * 1000.0
+
+    def getTimeSinceStart(self):
+        time_since = self.getCurrentTime() - self.packet_start_time
+        if time_since < 0.0:
+            self.packet_start_time = self.getCurrentTime()
+
+        return time_since
+
+    def _collect(self) -> None:
+        now = time.perf_counter()
+        while self._pending and self._pending[0][0] <= now:
+            self._rx_buffer.extend(self._pending.pop(0)[1])
+
+    def _step_motors(self, now: float) -> None:
+        dt = now - self._last_step
+        self._last_step = now
+        for motor in self.Motors.values():
+            motor.step(dt)
+
+    def _responding(self, dxl_id: int) -> List[SimulatedMotor]:
+        motor = self.Motors.get(dxl_id)
+        if motor is None or motor.Unresponsive:
+            return []
+        return [motor]
+
+    def _handle_instruction(self, packet: bytes):
+        '''
+        parse one instruction packet and return (motor, status packet) for every reply in wire order
+        '''
+        if len(packet) < 10 or packet[0:3] != b'\xff\xff\xfd':
+            return []
+
+        dxl_id = packet[4]
+        length = packet[5] | (packet[6] << 8)
+        if len(packet) < 7 + length:
+            return []
+        if update_crc(0, packet[:5 + length]) != (packet[5 + length] | (packet[6 + length] << 8)):
+            return [(motor, make_status_packet(motor.ID, ERRNUM_CRC)) for motor in self._responding(dxl_id)]
+
+        body = remove_stuffing(packet[7:5 + length])
+        instruction, params = body[0], body[1:]
+        replies = []
+
+        if instruction == INST_PING:
+            motors = sorted(self.Motors.values(), key=lambda m: m.ID) if dxl_id == BROADCAST_ID else self._responding(dxl_id)
+            for motor in motors:
+                if not motor.Unresponsive:
+                    replies.append((motor, make_status_packet(motor.ID, 0, struct.pack('<HB', motor._get(0, 2), motor.ControlTable[6]))))
+
+        elif instruction == INST_READ:
+            address, data_length = struct.unpack_from('<HH', params)
+            for motor in self._responding(dxl_id):
+                error, data = motor.read(address, data_length)
+                replies.append((motor, make_status_packet(motor.ID, error, data)))
+
+        elif instruction in (INST_WRITE, INST_REG_WRITE):
+            address = struct.unpack_from('<H', params)[0]
+            motors = list(self.Motors.values()) if dxl_id == BROADCAST_ID else self._responding(dxl_id)
+            for motor in motors:
+                error = motor.write(address, params[2:])
+                if dxl_id != BROADCAST_ID:
+                    replies.append((motor, make_status_packet(motor.ID, error)))
+
+        elif instruction in (INST_SYNC_READ, INST_FAST_SYNC_READ):
+            address, data_length = struct.unpack_from('<HH', params)
+            motors = [self.Motors[i] for i in params[4:] if i in self.Motors and not self.Motors[i].Unresponsive]
+            if instruction == INST_SYNC_READ:
+                for motor in motors:
+                    error, data = motor.read(address, data_length)
+                    replies.append((motor, make_status_packet(motor.ID, error, data)))
+            elif motors and len(motors) == len(params[4:]):
+                replies.append((motors[-1], self._fast_sync_read_reply(motors, address, data_length)))
+
+        elif instruction == INST_BULK_READ:
+            for offset in range(0, len(params), 5):
+                motor_id, address, data_length = struct.unpack_from('<BHH', params, offset)
+                for motor in self._responding(motor_id):
+                    error, data = motor.read(address, data_length)
+                    replies.append((motor, make_status_packet(motor.ID, error, data)))
+
+        elif instruction == INST_SYNC_WRITE:
+            address, data_length = struct.unpack_from('<HH', params)
+            for offset in range(4, len(params), data_length + 1):
+                motor = self.Motors.get(params[offset])
+                if motor is not None and not motor.Unresponsive:
+                    motor.write(address, params[offset + 1:offset + 1 + data_length])
+
+        elif instruction == INST_BULK_WRITE:
+            offset = 0
+            while offset + 5 <= len(params):
+                motor_id, address, data_length = struct.unpack_from('<BHH', params, offset)
+                motor = self.Motors.get(motor_id)
+                if motor is not None and not motor.Unresponsive:
+                    motor.write(address, params[offset + 5:offset + 5 + data_length])
+                offset += 5 + data_length
+
+        elif instruction == INST_REBOOT:
+            for motor in self._responding(dxl_id):
+                motor.ControlTable[64] = 0
+                replies.append((motor, make_status_packet(motor.ID, 0)))
+
+        else:
+            for motor in self._responding(dxl_id):
+                replies.append((motor, make_status_packet(motor.ID, ERRNUM_INSTRUCTION)))
+
+        return replies
+
+    def _fast_sync_read_reply(self, motors: List[SimulatedMotor], address: int, data_length: int) -> bytes:
+        '''
+        one concatenated status packet: [ERR ID DATA CRC] per motor, the last CRC closes the packet
+        '''
+        params = bytearray()
+        for index, motor in enumerate(motors):
+            error, data = motor.read(address, data_length)
+            params += bytes([error, motor.ID]) + data
+            if index != len(motors) - 1:
+                params += b'\x00\x00'
+
+        # the error of the first motor sits in the status packet error position
+        length = 1 + len(params) + 2
+        packet = bytes([0xFF, 0xFF, 0xFD, 0x00, BROADCAST_ID, length & 0xFF, (length >> 8) & 0xFF, INST_STATUS]) + params
+        crc = update_crc(0, packet)
+        return packet + bytes([crc & 0xFF, (crc >> 8) & 0xFF])
+
+
+def is_sim_port_name(port_name: str) -> bool:
+    return str(port_name).startswith(SIM_PORT_PREFIX)
+
+
+def parse_sim_port_name(port_name: str) -> List[int]:
+    spec = str(port_name)[len(SIM_PORT_PREFIX):]
+    if ',' in spec:
+        motors_id = [int(motor_id) for motor_id in spec.split(',') if motor_id.strip()]
+    else:
+        motor_num = int(spec or 1)
+        motors_id = list(range(0 if motor_num > MAX_ID else 1, motor_num + (0 if motor_num > MAX_ID else 1)))
+
+    if any(motor_id < 0 or motor_id > MAX_ID for motor_id in motors_id) or len(set(motors_id)) != len(motors_id):
+        raise ValueError(f"{port_name}: simulated motor ids must be unique and between 0 and {MAX_ID}")
+    return motors_id
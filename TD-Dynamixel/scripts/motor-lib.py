@@ -5,23 +5,23 @@ scriptOp is the OP which is cooking.
 
 ####################################################################################################
 # Dynamixel Classes and Functions
-from enum import Enum
+import csv
 import os
 from time import sleep
 from typing import List
 
-# Import suitable modules based on current OS (Windows/Mac)
+# Import suitable modules based on current OS (Windows/Mac), stdin is only touched when getch is called
 if os.name == 'nt':
-    import msvcrt
     def getch():
+        import msvcrt
         return msvcrt.getch().decode()
 else:
-    import sys, tty, termios
-    fd = sys.stdin.fileno()
-    old_settings = termios.tcgetattr(fd)
     def getch():
+        import sys, tty, termios
+        fd = sys.stdin.fileno()
+        old_settings = termios.tcgetattr(fd)
         try:
-            tty.setraw(sys.stdin.fileno())
+            tty.setraw(fd)
             ch = sys.stdin.read(1)
         finally:
             termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
@@ -50,8 +50,31 @@ class MotorControlAddress:
     MaxPosValue: int
 
 
-GLOBAL_COMM_CONFIG = op('GlobalCommConfig')
-GLOBAL_MOTORS_CONFIG = op('GlobalMotorsConfig')
+class Lazy:
+    '''
+    object created by factory on first use, so importing the script needs neither the project nor a port
+    '''
+    def __init__(self, factory) -> None:
+        self.Factory = factory
+        self.Object = None
+
+    def get(self):
+        if self.Object is None:
+            self.Object = self.Factory()
+        return self.Object
+
+    def reset(self):
+        self.Object = None
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+    def __getitem__(self, key):
+        return self.get()[key]
+
+
+GLOBAL_COMM_CONFIG = Lazy(lambda: op('GlobalCommConfig'))
+GLOBAL_MOTORS_CONFIG = Lazy(lambda: op('GlobalMotorsConfig'))
 
 
 def get_port_name():
@@ -70,8 +93,21 @@ def get_motor_num_from_config():
     return int(GLOBAL_MOTORS_CONFIG.numRows - 1)
 
 
-PORT_HANDLER = PortHandler(get_port_name())
-PACKET_HANDLER = PacketHandler(get_protocol())
+# port names starting with this run on the simulated bus in dynamixel_sim.py instead of a serial port
+SIM_PORT_PREFIX = 'sim://'
+
+
+def make_port_handler(port_name: str):
+    if port_name.startswith(SIM_PORT_PREFIX):
+        from dynamixel_sim import SimulatedPortHandler
+        return SimulatedPortHandler(port_name)
+
+    return PortHandler(port_name)
+
+
+# the SDK sets attributes on the port handler, pass PORT_HANDLER.get() to it rather than the Lazy
+PORT_HANDLER = Lazy(lambda: make_port_handler(get_port_name()))
+PACKET_HANDLER = Lazy(lambda: PacketHandler(get_protocol()))
 
 TORQUE_ENABLE               = 1     # Value for enabling the torque
 TORQUE_DISABLE              = 0     # Value for disabling the torque
@@ -102,7 +138,7 @@ def test_reading_configs():
 
 
 def test_broadcast_ping():
-    dxl_data_list, dxl_comm_result = PACKET_HANDLER.broadcastPing(PORT_HANDLER)
+    dxl_data_list, dxl_comm_result = PACKET_HANDLER.broadcastPing(PORT_HANDLER.get())
 
     if dxl_comm_result != COMM_SUCCESS:
         tx_rx_res = PACKET_HANDLER.getTxRxResult(dxl_comm_result)
@@ -114,67 +150,67 @@ def test_broadcast_ping():
         print(f"[ID: {dxl_id}] model version: {dxl_data_list.get(dxl_id)[0]} | firmware version: {dxl_data_list.get(dxl_id)[1]}")
 
 
-def get_motor_control_address(motor_type: str) -> MotorControlAddress:
-    motor_control_addresses = MotorControlAddress()
+# same registry as dynamixel_controller.py, the ControlTables DAT or configurations/ControlTables.csv
+CONTROL_TABLES_CONFIG = Lazy(lambda: op('ControlTables'))
+DEFAULT_CONTROL_TABLES_FILE = os.path.join('configurations', 'ControlTables.csv')
 
-    if motor_type == 'X_SERIES' or motor_type == 'MX_SERIES':
-        motor_control_addresses.TorqueEnable          = 64
-        motor_control_addresses.GoalPosition          = 116
-        motor_control_addresses.PresentPosition       = 132
-        motor_control_addresses.MinPosValue           = 0
-        motor_control_addresses.MaxPosValue           = 4095
-    elif motor_type == 'PRO_SERIES':
-        motor_control_addresses.TorqueEnable          = 562
-        motor_control_addresses.GoalPosition          = 596
-        motor_control_addresses.PresentPosition       = 611
-        motor_control_addresses.MinPosValue           = -150000
-        motor_control_addresses.MaxPosValue           = 150000
-    elif motor_type == 'P_SERIES' or motor_type == 'PRO_A_SERIES':
-        motor_control_addresses.TorqueEnable          = 512
-        motor_control_addresses.GoalPosition          = 564
-        motor_control_addresses.PresentPosition       = 580
-        motor_control_addresses.MinPosValue           = -150000
-        motor_control_addresses.MaxPosValue           = 150000
-    elif motor_type == 'XL320':
-        motor_control_addresses.TorqueEnable          = 24
-        motor_control_addresses.GoalPosition          = 30
-        motor_control_addresses.PresentPosition       = 37
-        motor_control_addresses.MinPosValue           = 0
-        motor_control_addresses.MaxPosValue           = 1023
-    else:
-        raise MotorTypeNotSupported(
-            f"motor_type: {motor_type} is not supported. Supported motor type: X_SERIES, MX_SERIES, PRO_SERIES, P_SERIES, PRO_A_SERIES and XL320")
+# goal position range of each motor type, not a register
+POSITION_VALUE_RANGES = {
+    'X_SERIES'     : (0, 4095),
+    'MX_SERIES'    : (0, 4095),
+    'PRO_SERIES'   : (-150000, 150000),
+    'P_SERIES'     : (-150000, 150000),
+    'PRO_A_SERIES' : (-150000, 150000),
+    'XL320'        : (0, 1023)
+}
 
-    return motor_control_addresses
 
+def get_control_tables_file() -> str:
+    '''
+    DEFAULT_CONTROL_TABLES_FILE in the project folder, TouchDesigner does not run with it as working directory
+    '''
+    try:
+        folder = project.folder
+    except NameError:
+        # outside TouchDesigner the scripts folder sits next to configurations
+        folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
 
-class DataAccess(Enum):
-    READ_AND_WRITE = 1
-    READ = 2
+    return os.path.join(folder, DEFAULT_CONTROL_TABLES_FILE)
 
 
-class ControlData:
-    def __init__(self, address: int, data_size_byte: int, data_access: DataAccess = DataAccess.READ) -> None:
-        self.Address = address
-        self.DataSize = data_size_byte
-        self.DataAccess = data_access
+def read_control_tables_rows() -> List[List[str]]:
+    table = CONTROL_TABLES_CONFIG.get()
+    if table is not None:
+        return [[str(table[row, col].val).strip() for col in range(table.numCols)] for row in range(table.numRows)]
 
+    with open(get_control_tables_file(), newline='') as file:
+        return [[cell.strip() for cell in row] for row in csv.reader(file) if row]
 
-class ControlTable:
-    def __init__(self, motor_type: str) -> None:
-        if motor_type == 'X_SERIES' or motor_type == 'MX_SERIES':
-            self.TorqueEnable          = ControlData(64, 1, DataAccess.READ_AND_WRITE)
-            self.GoalVelocity          = ControlData(116, 4, DataAccess.READ_AND_WRITE)
-            self.PresentPosition       = ControlData(132, 4, DataAccess.READ_AND_WRITE)
-        elif motor_type == 'PRO_SERIES':
-            raise NotImplementedError
-        elif motor_type == 'P_SERIES' or motor_type == 'PRO_A_SERIES':
-            raise NotImplementedError
-        elif motor_type == 'XL320':
-            raise NotImplementedError
-        else:
-            raise MotorTypeNotSupported(
-                f"motor_type: {motor_type} is not supported. Supported motor type: X_SERIES, MX_SERIES, PRO_SERIES, P_SERIES, PRO_A_SERIES and XL320")
+
+# motor type -> addresses, the registry is only read once per type
+MOTOR_CONTROL_ADDRESSES = {}
+
+
+def get_motor_control_address(motor_type: str) -> MotorControlAddress:
+    if motor_type in MOTOR_CONTROL_ADDRESSES:
+        return MOTOR_CONTROL_ADDRESSES[motor_type]
+
+    rows = read_control_tables_rows()
+    type_col, register_col, address_col = (rows[0].index(name) for name in ('Type', 'Register', 'Address'))
+    addresses = {row[register_col]: int(row[address_col]) for row in rows[1:] if row[type_col] == motor_type}
+
+    if not addresses or motor_type not in POSITION_VALUE_RANGES:
+        raise MotorTypeNotSupported(
+            f"motor_type: {motor_type} is not supported. Supported motor type: {', '.join(POSITION_VALUE_RANGES)}")
+
+    motor_control_addresses = MotorControlAddress()
+    motor_control_addresses.TorqueEnable          = addresses['Torque']
+    motor_control_addresses.GoalPosition          = addresses['GoalPosition']
+    motor_control_addresses.PresentPosition       = addresses['PresentPosition']
+    motor_control_addresses.MinPosValue, motor_control_addresses.MaxPosValue = POSITION_VALUE_RANGES[motor_type]
+    MOTOR_CONTROL_ADDRESSES[motor_type] = motor_control_addresses
+
+    return motor_control_addresses
 
 
 class Motor:
@@ -183,7 +219,33 @@ class Motor:
         self.ControlAddress = control_address
 
 
+# get_motors() result and the GlobalMotorsConfig state it was parsed from
+MOTORS_CACHE: List[Motor] = []
+MOTORS_CACHE_TABLE = None
+MOTORS_CACHE_VERSION = None
+
+
+def get_motors_config_version(table):
+    '''
+    changes whenever the table does: its cook counter in TouchDesigner, else a hash of its cells
+    '''
+    total_cooks = getattr(table, 'totalCooks', None)
+    if total_cooks is not None:
+        return total_cooks
+
+    return hash(tuple(str(table[row, col].val) for row in range(table.numRows) for col in range(table.numCols)))
+
+
 def get_motors() -> List[Motor]:
+    '''
+    the motors of GlobalMotorsConfig, only parsed again once the table changed so cook() allocates nothing per frame
+    '''
+    global MOTORS_CACHE, MOTORS_CACHE_TABLE, MOTORS_CACHE_VERSION
+    table = GLOBAL_MOTORS_CONFIG.get()
+    version = get_motors_config_version(table)
+    if table is MOTORS_CACHE_TABLE and version == MOTORS_CACHE_VERSION:
+        return MOTORS_CACHE
+
     motors: List(Motor) = []
 
     for i in range(get_motor_num_from_config()):
@@ -191,11 +253,12 @@ def get_motors() -> List[Motor]:
                         control_address = get_motor_control_address(str(GLOBAL_MOTORS_CONFIG[i+1, 1].val)))
         motors.append(motor)
 
+    MOTORS_CACHE, MOTORS_CACHE_TABLE, MOTORS_CACHE_VERSION = motors, table, version
     return motors
 
 
 def set_motor_torque(motor: Motor, val: int):
-    dxl_comm_result, dxl_error = PACKET_HANDLER.write1ByteTxRx(PORT_HANDLER, motor.ID, motor.ControlAddress.TorqueEnable, val)
+    dxl_comm_result, dxl_error = PACKET_HANDLER.write1ByteTxRx(PORT_HANDLER.get(), motor.ID, motor.ControlAddress.TorqueEnable, val)
 
     if dxl_comm_result != COMM_SUCCESS:
         raise CommError(PACKET_HANDLER.getTxRxResult(dxl_comm_result))
@@ -211,6 +274,12 @@ def test_enable_disable_torque():
 # Touchdesigner Classes and Functions
 
 
+class MotorCommand:
+    def __init__(self, torque_enable: int, goal_velocity: int) -> None:
+        self.TorqueEnable = torque_enable
+        self.GoalVelocity = goal_velocity
+
+
 class InputParser:
     def __init__(self, script_op) -> None:
         self._script_op = script_op
@@ -281,4 +350,3 @@ def cook(scriptOp):
     c[0] = input_parser.get_input_torque_enable(1)
     d[0] = input_parser.get_input_goal_velocity(1)
 '''
-test_reading_configs()